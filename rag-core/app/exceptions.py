@@ -26,3 +26,7 @@ class UnauthorizedException(BaseAppException):
 class BadRequestException(BaseAppException):
     def __init__(self, message: str):
         super().__init__(message, status_code=400, code="BAD_REQUEST")
+
+class ServiceUnavailableException(BaseAppException):
+    def __init__(self, message: str):
+        super().__init__(message, status_code=503, code="SERVICE_UNAVAILABLE")
@@ -1,40 +1,88 @@
 import sys
+import time
 import asyncio
 
+_IMPORT_STARTED = time.perf_counter()
+
 # Fix for Playwright on Windows: Force ProactorEventLoop
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, Query
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 from app.services.ingestion import IngestionService
 from app.services.retrieval import RetrievalService
 from app.services.generation import GenerationService
+from app.services.intent_router import IntentRouter
+from app.services.answer_cache import AnswerCache
+from app.services.session_store import SessionStore
+from app.services.namespace_lifecycle import NamespaceCatalog, NamespaceLifecycleManager, catalog_is_shared
+from app.services.chunk_store import ChunkStore
+from app.services.quantization import SUPPORTED_DTYPES, quantize
 import uvicorn
 import os
 import uuid
-import time
-from app.exceptions import BaseAppException
+import sqlite3
+from app.exceptions import BaseAppException, BadRequestException, ResourceNotFoundException, ServiceUnavailableException
 from app.exception_handlers import app_exception_handler, general_exception_handler
+from app.timing import start_request_timing, format_server_timing, stage
+from app.startup import StartupTracker
 
 app = FastAPI(title="Velora AI RAG Core Service", version="1.0.0")
 
-# Background task for auto-cleanup
-async def schedule_db_reset():
-    RESET_DELAY_SECONDS = 24 * 60 * 60  # 24 Hours
-    # RESET_DELAY_SECONDS = 10 * 60         # 10 Minutes
-    
-    print(f"INFO: Database auto-reset scheduled in {RESET_DELAY_SECONDS} seconds.", flush=True)
-    await asyncio.sleep(RESET_DELAY_SECONDS)
-    
-    print("INFO: Executing scheduled database reset...", flush=True)
-    await ingestion_service.reset_database()
-    print("INFO: Scheduled database reset completed.", flush=True)
+# Background task for auto-cleanup: incremental, per-namespace eviction
+async def run_namespace_sweeper():
+    await ensure_services()
+    if lifecycle_manager is None:
+        print("INFO: Namespace sweeper disabled (catalog disabled or not shared by every replica, "
+              "see NAMESPACE_CATALOG_SHARED); vectors expire by their Upstash TTL only.", flush=True)
+        return
+    await lifecycle_manager.run_forever()
+
+# Answer caches are per process: pick up re-ingests handled by other workers
+async def run_answer_cache_sync():
+    await ensure_services()
+    catalog = ingestion_service.catalog
+    if not answer_cache.enabled or catalog is None:
+        return
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            shared = await loop.run_in_executor(None, catalog.generations)
+            answer_cache.apply_shared_generations(shared)
+        except sqlite3.Error as e:
+            print(f"WARNING: Answer cache sync failed: {e}", flush=True)
+        await asyncio.sleep(answer_cache.sync_seconds)
+
+async def invalidate_answers(namespace: Optional[str]):
+    """
+    Drop cached answers for a re-ingested namespace in this worker and,
+    through the catalog, in every other worker.
+    """
+    answer_cache.invalidate_namespace(namespace)
+    catalog = ingestion_service.catalog
+    if catalog is None:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+        generation = await loop.run_in_executor(None, catalog.bump_generation, namespace or "")
+        answer_cache.note_shared_generation(namespace, generation)
+    except sqlite3.Error as e:
+        print(f"WARNING: Failed to propagate cache invalidation for {namespace}: {e}", flush=True)
 
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(schedule_db_reset())
+    # Load models in the background so liveness probes answer immediately
+    asyncio.create_task(ensure_services())
+    asyncio.create_task(run_namespace_sweeper())
+    asyncio.create_task(run_answer_cache_sync())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if generation_service is not None:
+        await generation_service.llm_client.close()
 
 @app.middleware("http")
 async def add_correlation_id(request: Request, call_next):
@@ -44,8 +92,13 @@ async def add_correlation_id(request: Request, call_next):
     
     # We can't directly mutate headers in request, but we can access it in handlers
     # To propagate to response:
+    timings = start_request_timing()
+    start = time.perf_counter()
     response = await call_next(request)
+    timings["total"] = (time.perf_counter() - start) * 1000
     response.headers["X-Correlation-ID"] = correlation_id
+    # Per-stage breakdown (used by the load-test harness and browser devtools)
+    response.headers["Server-Timing"] = format_server_timing(timings)
     return response
 
 app.add_exception_handler(BaseAppException, app_exception_handler)
@@ -55,7 +108,13 @@ class QueryRequest(BaseModel):
     query: str
     top_k: int = 10
     namespace: Optional[str] = None
+    # Federated search: query several namespaces at once (merged with `namespace`)
+    namespaces: List[str] = []
     history: List[Dict] = []
+    # Server-side conversation: send only the new message; `history` is then ignored.
+    # Set start_session to get a new session_id in the response, then send it back
+    session_id: Optional[str] = None
+    start_session: bool = False
 
 class IngestRequest(BaseModel):
     urls: List[str]
@@ -65,20 +124,87 @@ class IngestRequest(BaseModel):
 
 class QueryResponse(BaseModel):
     answer: Dict
+    session_id: Optional[str] = None
+
+# Services are created by load_services() on startup (or on first request)
+ingestion_service: Optional[IngestionService] = None
+retrieval_service: Optional[RetrievalService] = None
+generation_service: Optional[GenerationService] = None
+intent_router: Optional[IntentRouter] = None
+lifecycle_manager: Optional[NamespaceLifecycleManager] = None
+answer_cache = AnswerCache()
+session_store = SessionStore()
+startup = StartupTracker()
+
+def open_namespace_catalog() -> Optional[NamespaceCatalog]:
+    """
+    The catalog is optional: without it (disabled, or a read-only filesystem
+    such as serverless deployments) vectors expire by their Upstash TTL alone.
+    """
+    if os.getenv("ENABLE_NAMESPACE_CATALOG", "true").lower() != "true":
+        return None
+    try:
+        return NamespaceCatalog()
+    except (OSError, sqlite3.Error) as e:
+        print(f"WARNING: Namespace catalog unavailable ({e}); falling back to Upstash TTL expiry", flush=True)
+        return None
+
+def load_services():
+    """
+    Construct services and load their models. Blocking; idempotent.
+    """
+    global ingestion_service, retrieval_service, generation_service, intent_router, lifecycle_manager
+    if retrieval_service is None:
+        with startup.phase("retrieval_models"):
+            # Opt-in: the store becomes the only copy of chunk text, so DATA_DIR must be a
+            # persistent volume shared by every instance that ingests or queries
+            chunk_store = ChunkStore() if os.getenv("ENABLE_CHUNK_STORE", "false").lower() == "true" else None
+            retrieval_service = RetrievalService(chunk_store=chunk_store)
+    if ingestion_service is None:
+        with startup.phase("ingestion"):
+            # Shares the MiniLM instance instead of loading a second copy
+            ingestion_service = IngestionService(
+                embeddings=retrieval_service.embeddings,
+                catalog=open_namespace_catalog(),
+                chunk_store=retrieval_service.chunk_store
+            )
+            if ingestion_service.catalog is not None and catalog_is_shared():
+                lifecycle_manager = NamespaceLifecycleManager(
+                    ingestion_service.index, ingestion_service.catalog, ingestion_service.chunk_store
+                )
+    if generation_service is None:
+        with startup.phase("generation"):
+            generation_service = GenerationService()
+    if intent_router is None:
+        with startup.phase("intent_router"):
+            intent_router = IntentRouter(retrieval_service.embeddings)
 
-# Initialize services
-ingestion_service = IngestionService()
-retrieval_service = RetrievalService()
-generation_service = GenerationService()
+def warm_up_services():
+    """
+    Run throwaway inference passes so the first real request doesn't pay
+    for lazy allocation and kernel selection.
+    """
+    with startup.phase("warmup"):
+        retrieval_service.warm_up()
+        generation_service.warm_up()
+
+def initialize_services():
+    load_services()
+    warm_up_services()
+
+async def ensure_services():
+    await startup.ensure_ready(initialize_services)
 
 @app.post("/internal/ingest")
 async def ingest_urls(request: IngestRequest):
+    await ensure_services()
     results = await ingestion_service.ingest(
         request.urls, 
         request.namespace, 
         request.recursive, 
         request.max_pages
     )
+    await invalidate_answers(request.namespace)
     return {"status": "success", "processed_pages": len(request.urls), "details": results}
 
 @app.post("/internal/ingest-files")
@@ -86,32 +212,210 @@ async def ingest_files(
     files: List[UploadFile] = File(...), 
     namespace: str = Form(None)
 ):
+    await ensure_services()
     file_data = []
     for file in files:
         content = await file.read()
         file_data.append((file.filename, content))
         
     results = await ingestion_service.ingest_files(file_data, namespace)
+    await invalidate_answers(namespace)
     return {"status": "success", "processed_files": len(files), "details": results}
 
+@app.get("/internal/namespaces")
+async def list_namespaces():
+    await ensure_services()
+    if ingestion_service.catalog is None:
+        raise ServiceUnavailableException("Namespace catalog is disabled (ENABLE_NAMESPACE_CATALOG)")
+    loop = asyncio.get_running_loop()
+    namespaces = await loop.run_in_executor(None, ingestion_service.catalog.list_namespaces)
+    return {"namespaces": namespaces}
+
 @app.post("/internal/embed")
-async def get_embeddings(texts: List[str]):
-    embeddings = retrieval_service.generate_embeddings(texts)
-    return {"embeddings": embeddings}
+async def get_embeddings(texts: List[str], dtype: Optional[str] = Query(None)):
+    """
+    Without `dtype`, returns {"embeddings": [[float, ...], ...]}.
+
+    With dtype=float32|float16|int8, streams a little-endian, row-major
+    binary matrix instead, embedded and sent EMBED_STREAM_BATCH_SIZE rows
+    at a time. X-Embedding-Shape is "rows,dim"; int8 rows are a float32
+    scale followed by dim int8 values (value = int8 * scale).
+    """
+    await ensure_services()
+    loop = asyncio.get_running_loop()
+    if dtype is None:
+        embeddings = await loop.run_in_executor(None, retrieval_service.generate_embeddings, texts)
+        return {"embeddings": embeddings}
+    
+    dtype = dtype.lower()
+    if dtype not in SUPPORTED_DTYPES:
+        raise BadRequestException(f"dtype must be one of {', '.join(SUPPORTED_DTYPES)}")
+    
+    batch_size = int(os.getenv("EMBED_STREAM_BATCH_SIZE", "256"))
+    dimension = await loop.run_in_executor(None, lambda: retrieval_service.embedding_dimension)
+    
+    async def body():
+        for i in range(0, len(texts), batch_size):
+            with stage("embed"):
+                matrix = await loop.run_in_executor(None, retrieval_service.embed_array, texts[i:i + batch_size])
+            yield quantize(matrix, dtype)
+    
+    headers = {
+        "X-Embedding-Shape": f"{len(texts)},{dimension}",
+        "X-Embedding-Dtype": dtype,
+        "X-Embedding-Byte-Order": "little",
+        "X-Embedding-Layout": "row-scale-f32" if dtype == "int8" else "row-major",
+    }
+    return StreamingResponse(body(), media_type="application/octet-stream", headers=headers)
+
+def _target_namespaces(request: QueryRequest) -> List[str]:
+    namespaces = ([request.namespace] if request.namespace else []) + request.namespaces
+    return list(dict.fromkeys(ns for ns in namespaces if ns))
+
+def _check_namespaces(request: QueryRequest):
+    # Each namespace costs one vector query per query variation, all on the shared executor
+    max_namespaces = int(os.getenv("MAX_QUERY_NAMESPACES", "8"))
+    if len(_target_namespaces(request)) > max_namespaces:
+        raise BadRequestException(f"At most {max_namespaces} namespaces can be searched per query")
+
+async def _route_and_retrieve(request: QueryRequest):
+    """
+    Returns (canned_answer, results). Chit-chat is answered or sent to
+    generation without touching the retrieval pipeline.
+    """
+    # Classify intent first: chit-chat never needs document context
+    with stage("intent"):
+        route = await intent_router.route(request.query)
+    
+    if route["route"] == IntentRouter.ROUTE_CANNED:
+        # Mid-conversation, "sure" or "ok" may answer the assistant's last question
+        if not request.history and not request.session_id and not request.start_session:
+            return intent_router.canned_response(route["intent"]), []
+        return None, []
+    
+    if route["route"] == IntentRouter.ROUTE_GENERATE:
+        return None, []
+    
+    # Retrieve relevant results (vector searches fan out concurrently across namespaces)
+    results = await retrieval_service.search(
+        request.query, request.top_k, _target_namespaces(request), query_vector=route["query_vector"]
+    )
+    return None, results
+
+def _check_session_id(session_id: str):
+    if len(session_id) > SessionStore.MAX_SESSION_ID_LENGTH:
+        raise BadRequestException(f"session_id must be at most {SessionStore.MAX_SESSION_ID_LENGTH} characters")
+
+async def _load_session(request: QueryRequest):
+    if request.session_id:
+        _check_session_id(request.session_id)
+        session = await session_store.get(request.session_id)
+        if session is None:
+            # IDs are server-issued; unknown or expired ones start over with start_session
+            raise ResourceNotFoundException(f"Session '{request.session_id}' not found")
+        return session
+    if request.start_session:
+        return await session_store.create()
+    return None
+
+def _history_key(request: QueryRequest, session) -> List[Dict]:
+    # A session's content (not an in-process counter, which restarts on reload) stands in for the history
+    if session is None:
+        return request.history
+    return [{"summary": session.summary}] + session.messages
+
+def _is_cacheable(answer: Dict) -> bool:
+    if answer.get("extracted_data", {}).get("degraded"):
+        return False
+    return answer.get("summary") != GenerationService.ERROR_MESSAGE
 
 @app.post("/query", response_model=QueryResponse)
 async def query_index(request: QueryRequest):
-    # Retrieve relevant results
-    results = await retrieval_service.search(request.query, request.top_k, request.namespace)
+    await ensure_services()
+    _check_namespaces(request)
+    session = await _load_session(request)
+    
+    async def compute():
+        canned, results = await _route_and_retrieve(request)
+        if canned:
+            return canned
+        
+        # Generate answer based on results
+        with stage("generate"):
+            return await generation_service.generate_answer(request.query, results, request.history, session=session)
+    
+    # Identical concurrent queries share one computation; answers are cached until re-ingest
+    key = AnswerCache.make_key(_target_namespaces(request), request.query, _history_key(request, session), request.top_k)
+    answer = await answer_cache.get_or_compute(key, compute, _is_cacheable)
+    
+    if session is not None and answer.get("summary") != GenerationService.ERROR_MESSAGE:
+        await session_store.append_turn(
+            session, request.query, answer.get("summary", ""), generation_service.summarize_history
+        )
+    return QueryResponse(answer=answer, session_id=session.session_id if session is not None else None)
+
+@app.post("/query/stream")
+async def query_index_stream(request: QueryRequest):
+    await ensure_services()
+    _check_namespaces(request)
+    session = await _load_session(request)
+    
+    async def produce():
+        canned, results = await _route_and_retrieve(request)
+        if canned:
+            yield canned["summary"]
+            return
+        async for token in generation_service.astream_answer(request.query, results, request.history, session=session):
+            yield token
     
-    # Generate answer based on results
-    answer = generation_service.generate_answer(request.query, results, request.history)
+    key = AnswerCache.make_key(_target_namespaces(request), request.query, _history_key(request, session), request.top_k)
     
-    return QueryResponse(answer=answer)
+    async def body():
+        tokens = []
+        try:
+            async for token in answer_cache.stream(key, produce):
+                tokens.append(token)
+                yield token
+        except Exception as e:
+            print(f"ERROR: Streaming answer failed: {e}", flush=True)
+            yield GenerationService.ERROR_MESSAGE
+            return
+        if session is not None:
+            await session_store.append_turn(
+                session, request.query, "".join(tokens), generation_service.summarize_history
+            )
+    
+    headers = {"X-Session-ID": session.session_id} if session is not None else None
+    return StreamingResponse(body(), media_type="text/plain; charset=utf-8", headers=headers)
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    _check_session_id(session_id)
+    # Lookup only: unknown IDs must not create sessions (and evict real ones from the LRU)
+    session = await session_store.find(session_id)
+    if session is None:
+        raise ResourceNotFoundException(f"Session '{session_id}' not found")
+    return session.to_dict()
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    _check_session_id(session_id)
+    await session_store.delete(session_id)
+    return {"status": "deleted", "session_id": session_id}
 
 @app.get("/health")
+@app.get("/health/live")
 async def health():
+    # Liveness: the process and event loop are responsive
     return {"status": "healthy"}
 
+@app.get("/health/ready")
+async def health_ready():
+    # Readiness: models are loaded and warmed up
+    status = startup.status()
+    return JSONResponse(status_code=200 if startup.ready else 503, content=status)
+
+startup.phases["import"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 2)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,248 @@
+import os
+import re
+import json
+import time
+import hashlib
+import asyncio
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+# (namespaces, normalized query, history fingerprint)
+CacheKey = Tuple[Tuple[str, ...], str, str]
+
+class StreamBroadcast:
+    """
+    Fans one token stream out to any number of subscribers.
+
+    The producer runs as its own task, so a disconnecting client never
+    cancels the stream for the others. Chunks are buffered, which lets late
+    subscribers replay the stream from the start.
+    """
+
+    def __init__(self, producer: Callable[[], AsyncIterator[str]]):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Condition()
+        self.task = asyncio.ensure_future(self._run(producer))
+
+    async def _run(self, producer: Callable[[], AsyncIterator[str]]):
+        try:
+            async for chunk in producer():
+                self.chunks.append(chunk)
+                async with self._changed:
+                    self._changed.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.done = True
+            async with self._changed:
+                self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        position = 0
+        while True:
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            async with self._changed:
+                await self._changed.wait_for(lambda: position < len(self.chunks) or self.done)
+
+class AnswerCache:
+    """
+    Single-flight request coalescing plus a bounded TTL cache for answers.
+
+    Concurrent identical queries (same namespaces, normalized query and
+    history) share one in-flight computation or token stream. Completed
+    answers are cached until they expire or any of their namespaces is
+    re-ingested.
+
+    The cache is per process. Re-ingests in other worker processes are
+    picked up through shared generation counters (see
+    apply_shared_generations), polled every ANSWER_CACHE_SYNC_SECONDS.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ENABLE_ANSWER_CACHE", "true").lower() == "true"
+        self.ttl_seconds = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "300"))
+        self.max_entries = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+        self.sync_seconds = float(os.getenv("ANSWER_CACHE_SYNC_SECONDS", "2"))
+
+        # key -> (expires_at, answer); ordered oldest-used first for LRU eviction
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[CacheKey, asyncio.Future] = {}
+        self._streams: Dict[CacheKey, StreamBroadcast] = {}
+        # Bumped on re-ingest so computations started before it are not cached
+        self._generations: Dict[str, int] = {}
+        # Last seen value of each namespace's shared (cross-process) generation
+        self._shared_generations: Dict[str, int] = {}
+        self._shared_synced = False
+        # Outcome counters: served from cache, joined an in-flight request, computed
+        self.stats = {"hits": 0, "coalesced": 0, "misses": 0}
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return re.sub(r"\s+", " ", query.lower()).strip().rstrip("?!.")
+
+    @staticmethod
+    def make_key(namespace: Union[str, List[str], None], query: str, history: List[Dict], top_k: int) -> CacheKey:
+        # top_k changes the retrieved context, so it is part of the fingerprint
+        history_fingerprint = hashlib.sha1(
+            json.dumps([history, top_k], sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        if isinstance(namespace, str) or not namespace:
+            namespaces = (namespace or "",)
+        else:
+            namespaces = tuple(sorted(set(namespace)))
+        return (namespaces, AnswerCache.normalize_query(query), history_fingerprint)
+
+    def _generation(self, key: CacheKey) -> Tuple[int, ...]:
+        return tuple(self._generations.get(namespace, 0) for namespace in key[0])
+
+    def get(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, answer = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def _store(self, key: CacheKey, generation: Tuple[int, ...], answer: Dict[str, Any]):
+        # Skip answers computed against data that has since been re-ingested
+        if self._generation(key) != generation:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(
+        self,
+        key: CacheKey,
+        compute: Callable[[], Awaitable[Dict[str, Any]]],
+        is_cacheable: Callable[[Dict[str, Any]], bool] = lambda answer: True,
+    ) -> Dict[str, Any]:
+        """
+        Return a cached answer, join an identical in-flight computation, or
+        start one.
+
+        Args:
+            key: Cache key from make_key
+            compute: Coroutine factory producing the answer
+            is_cacheable: Predicate deciding whether a result may be cached
+
+        Returns:
+            The answer dict
+        """
+        if not self.enabled:
+            return await compute()
+
+        cached = self.get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+            generation = self._generation(key)
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+
+            def _finished(done: asyncio.Future):
+                if self._inflight.get(key) is done:
+                    del self._inflight[key]
+                if not done.cancelled() and done.exception() is None and is_cacheable(done.result()):
+                    self._store(key, generation, done.result())
+
+            task.add_done_callback(_finished)
+
+        # Shield so one caller's cancellation doesn't cancel the shared computation
+        return await asyncio.shield(task)
+
+    async def stream(
+        self,
+        key: CacheKey,
+        producer: Callable[[], AsyncIterator[str]],
+        is_cacheable: Callable[[str], bool] = lambda text: True,
+    ) -> AsyncIterator[str]:
+        """
+        Stream an answer, sharing one token stream between identical requests.
+        The full text is cached once the stream completes successfully.
+        """
+        if not self.enabled:
+            async for chunk in producer():
+                yield chunk
+            return
+
+        cached = self.get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            yield cached.get("summary", "")
+            return
+
+        broadcast = self._streams.get(key)
+        if broadcast is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+            generation = self._generation(key)
+            broadcast = StreamBroadcast(producer)
+            self._streams[key] = broadcast
+
+            def _finished(_task: asyncio.Future):
+                if self._streams.get(key) is broadcast:
+                    del self._streams[key]
+                text = "".join(broadcast.chunks)
+                if broadcast.error is None and is_cacheable(text):
+                    self._store(key, generation, {"summary": text, "extracted_data": {}})
+
+            broadcast.task.add_done_callback(_finished)
+
+        async for chunk in broadcast.subscribe():
+            yield chunk
+
+    def invalidate_namespace(self, namespace: Optional[str]):
+        """
+        Drop cached answers involving a namespace after it has been re-ingested.
+        In-flight computations keep serving their current waiters but are
+        no longer joinable and won't be cached.
+        """
+        namespace = namespace or ""
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        for key in [k for k in self._entries if namespace in k[0]]:
+            del self._entries[key]
+        for key in [k for k in self._inflight if namespace in k[0]]:
+            del self._inflight[key]
+        for key in [k for k in self._streams if namespace in k[0]]:
+            del self._streams[key]
+
+    def note_shared_generation(self, namespace: Optional[str], generation: int):
+        """
+        Record a shared generation this process bumped itself, so the next
+        sync doesn't invalidate the namespace a second time.
+        """
+        self._shared_generations[namespace or ""] = generation
+
+    def apply_shared_generations(self, shared: Dict[str, int]):
+        """
+        Invalidate namespaces whose shared generation changed since the last
+        sync, i.e. that were re-ingested by another worker process.
+        """
+        for namespace, generation in shared.items():
+            # The first sync only records a baseline; namespaces appearing
+            # later were first ingested after it (generation 0 before that)
+            seen = self._shared_generations.get(namespace, 0)
+            if self._shared_synced and seen != generation:
+                self.invalidate_namespace(namespace)
+            self._shared_generations[namespace] = generation
+        self._shared_synced = True
@@ -0,0 +1,142 @@
+import os
+import time
+import zlib
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from app.services.quantization import SUPPORTED_DTYPES, quantize, dequantize, row_nbytes
+
+class ChunkStore:
+    """
+    Local content-addressed store for chunk text, keyed by chunk (vector) ID.
+
+    Keeps full chunk bodies out of vector metadata: the index returns IDs
+    and small fields, and text is fetched here in one batch only for the
+    candidates that reach re-ranking. Bodies are zlib-compressed; the SQLite
+    file is memory-mapped so reads come straight from the page cache.
+
+    With CHUNK_STORE_VECTOR_DTYPE set, each chunk's embedding is kept
+    alongside it as a float32, float16 or int8-quantized blob, so vectors
+    can be reused locally without another round trip to the index.
+    """
+
+    # SQLite caps bound parameters per statement
+    MAX_BATCH = 500
+
+    def __init__(self, path: str = None):
+        data_dir = os.getenv("DATA_DIR", "data")
+        self.path = path or os.path.join(data_dir, "chunks.db")
+        self.compression_level = int(os.getenv("CHUNK_STORE_COMPRESSION_LEVEL", "6"))
+        self.mmap_bytes = int(os.getenv("CHUNK_STORE_MMAP_BYTES", str(256 * 1024 * 1024)))
+        # "none" keeps text only; float32 / float16 / int8 also store vectors
+        self.vector_dtype = os.getenv("CHUNK_STORE_VECTOR_DTYPE", "none").lower()
+        if self.vector_dtype not in ("none",) + SUPPORTED_DTYPES:
+            raise ValueError(f"CHUNK_STORE_VECTOR_DTYPE must be 'none' or one of {SUPPORTED_DTYPES}")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                body BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                vector BLOB,
+                vector_dtype TEXT
+            )
+        """)
+        # Stores created before vectors were kept locally
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}
+        if "vector" not in columns:
+            conn.execute("ALTER TABLE chunks ADD COLUMN vector BLOB")
+            conn.execute("ALTER TABLE chunks ADD COLUMN vector_dtype TEXT")
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread (and per process: never reuse one across fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={self.mmap_bytes}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def put_many(self, namespace: str, chunks: List[Tuple[str, str]], vectors: Optional[List[List[float]]] = None):
+        """
+        Store (chunk_id, text) pairs, plus their embeddings (same order) when
+        vector storage is enabled. Re-ingesting the same chunk overwrites it.
+        """
+        if not chunks:
+            return
+        now = time.time()
+        blobs = [None] * len(chunks)
+        dtype = None
+        if vectors is not None and self.vector_dtype != "none":
+            dtype = self.vector_dtype
+            matrix = np.asarray(vectors, dtype=np.float32)
+            encoded = quantize(matrix, dtype)
+            size = row_nbytes(dtype, matrix.shape[1])
+            blobs = [encoded[i * size:(i + 1) * size] for i in range(len(chunks))]
+        rows = [
+            (chunk_id, namespace, zlib.compress(text.encode("utf-8"), self.compression_level), now, blob, dtype)
+            for (chunk_id, text), blob in zip(chunks, blobs)
+        ]
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, namespace, body, created_at, vector, vector_dtype) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def get_many(self, chunk_ids: List[str]) -> Dict[str, str]:
+        """
+        Batch-fetch chunk texts. IDs not in the store are omitted.
+        """
+        texts: Dict[str, str] = {}
+        conn = self._connection()
+        for i in range(0, len(chunk_ids), self.MAX_BATCH):
+            batch = chunk_ids[i:i + self.MAX_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            for chunk_id, body in conn.execute(
+                f"SELECT chunk_id, body FROM chunks WHERE chunk_id IN ({placeholders})", batch
+            ):
+                texts[chunk_id] = zlib.decompress(body).decode("utf-8")
+        return texts
+
+    def get_vectors(self, chunk_ids: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Batch-fetch stored embeddings as float32 arrays (dequantized).
+        IDs without a stored vector are omitted.
+        """
+        vectors: Dict[str, np.ndarray] = {}
+        conn = self._connection()
+        for i in range(0, len(chunk_ids), self.MAX_BATCH):
+            batch = chunk_ids[i:i + self.MAX_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            for chunk_id, blob, dtype in conn.execute(
+                f"SELECT chunk_id, vector, vector_dtype FROM chunks "
+                f"WHERE chunk_id IN ({placeholders}) AND vector IS NOT NULL", batch
+            ):
+                # Dimension follows from the blob size (int8 rows carry a 4-byte scale)
+                dim = len(blob) - 4 if dtype == "int8" else len(blob) // row_nbytes(dtype, 1)
+                vectors[chunk_id] = dequantize(blob, dtype, dim)[0]
+        return vectors
+
+    def delete_many(self, chunk_ids: List[str]):
+        conn = self._connection()
+        with conn:
+            for i in range(0, len(chunk_ids), self.MAX_BATCH):
+                batch = chunk_ids[i:i + self.MAX_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({placeholders})", batch)
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM chunks")
@@ -0,0 +1,209 @@
+import os
+import re
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+class ContextPacker:
+    """
+    Token-budgeted prompt packing for generation.
+
+    Merges adjacent or overlapping chunks from the same source, drops
+    near-duplicates and fills a fixed prompt budget in rerank-score order.
+    A merged segment too large for the remaining budget is split back into
+    its chunks, which then compete individually.
+    Token counts come from the generation model's tokenizer, falling back
+    to a character estimate when it cannot be loaded (e.g. gated repo).
+    """
+
+    # Rough characters-per-token ratio for the fallback estimate
+    CHARS_PER_TOKEN = 4
+    # Chat templates add a few tokens of framing around every message
+    MESSAGE_OVERHEAD_TOKENS = 4
+    # Shortest shared prefix/suffix treated as splitter overlap (chunks carry no offsets)
+    MIN_TEXT_OVERLAP = 20
+    MAX_TEXT_OVERLAP = 400
+
+    def __init__(self, model_id: str, api_token: Optional[str] = None):
+        # About what the top 5 chunks of 400 characters cost before packing existed
+        self.context_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "500"))
+        self.history_budget = int(os.getenv("HISTORY_TOKEN_BUDGET", "800"))
+        self.dedup_threshold = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.85"))
+        self.tokenizer = self._load_tokenizer(os.getenv("CONTEXT_TOKENIZER", model_id), api_token)
+
+    def _load_tokenizer(self, model_id: str, api_token: Optional[str]):
+        try:
+            from transformers import AutoTokenizer
+            return AutoTokenizer.from_pretrained(model_id, token=api_token)
+        except Exception as e:
+            print(f"WARNING: Could not load tokenizer for {model_id}, estimating token counts: {e}", flush=True)
+            return None
+
+    def count_tokens(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        return max(1, len(text) // self.CHARS_PER_TOKEN)
+
+    def pack_context(self, results: List[Dict[str, Any]]) -> str:
+        """
+        Build the context block for the prompt.
+
+        Args:
+            results: Re-ranked search results with 'text', 'score', 'url' and 'metadata'
+
+        Returns:
+            Context string that fits within the configured token budget
+        """
+        queue = self._merge_segments(results)
+        queue.sort(key=lambda s: s["score"], reverse=True)
+
+        packed = []
+        packed_shingles: List[Set[Tuple[str, ...]]] = []
+        remaining = self.context_budget
+        i = 0
+        while i < len(queue):
+            segment = queue[i]
+            i += 1
+            shingles = self._shingles(segment["text"])
+            if any(self._jaccard(shingles, other) >= self.dedup_threshold for other in packed_shingles):
+                continue
+
+            entry = f"Content: {segment['text']}"
+            tokens = self.count_tokens(entry)
+            if tokens > remaining:
+                chunks = segment["chunks"]
+                if len(chunks) > 1:
+                    # Too large as a whole: its chunks compete on their own scores
+                    queue[i:] = sorted(
+                        queue[i:] + [{"text": c["text"], "score": c["score"], "chunks": [c]} for c in chunks],
+                        key=lambda s: s["score"], reverse=True,
+                    )
+                    continue
+                if packed:
+                    # A smaller, lower-ranked segment may still fit
+                    continue
+                # The best chunk alone exceeds the budget: send as much of it as fits
+                entry = self._truncate(entry, remaining)
+                tokens = self.count_tokens(entry)
+
+            packed.append(entry)
+            packed_shingles.append(shingles)
+            remaining -= tokens
+
+        return "\n\n".join(packed)
+
+    def trim_history(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Keep the most recent messages that fit within the history token budget.
+
+        Args:
+            messages: Chronological list of {"role", "content"} dicts with string content
+
+        Returns:
+            The newest suffix of messages within budget, in chronological order
+        """
+        kept = []
+        remaining = self.history_budget
+        for message in reversed(messages):
+            tokens = self.count_tokens(message["content"]) + self.MESSAGE_OVERHEAD_TOKENS
+            if tokens > remaining:
+                break
+            kept.append(message)
+            remaining -= tokens
+        kept.reverse()
+        return kept
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        if self.tokenizer is not None:
+            ids = self.tokenizer.encode(text, add_special_tokens=False)[:max_tokens]
+            return self.tokenizer.decode(ids)
+        return text[:max_tokens * self.CHARS_PER_TOKEN]
+
+    def _merge_segments(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        groups: Dict[Any, List[Dict[str, Any]]] = {}
+        for i, res in enumerate(results):
+            text = res.get("text")
+            if not text:
+                continue
+            metadata = res.get("metadata") or {}
+            # Pages of one file share a URL but restart their offsets
+            key = (res.get("url"), metadata.get("page")) if res.get("url") else ("__ungrouped__", i)
+            groups.setdefault(key, []).append({
+                "text": text,
+                "score": res.get("score", 0.0),
+                "start": metadata.get("start_index"),
+            })
+        # Every segment keeps the chunks it was merged from, to split it again if needed
+
+        segments = []
+        for chunks in groups.values():
+            if all(c["start"] is not None for c in chunks):
+                segments.extend(self._merge_by_offset(chunks))
+            else:
+                segments.extend(self._merge_by_text(chunks))
+        return segments
+
+    def _merge_by_offset(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        merged: List[Dict[str, Any]] = []
+        for chunk in sorted(chunks, key=lambda c: c["start"]):
+            end = chunk["start"] + len(chunk["text"])
+            if merged and chunk["start"] <= merged[-1]["end"] + 2:
+                last = merged[-1]
+                overlap = last["end"] - chunk["start"]
+                if overlap >= 0:
+                    last["text"] += chunk["text"][overlap:]
+                else:
+                    # Adjacent: the splitter dropped only the separator whitespace
+                    last["text"] += "\n" + chunk["text"]
+                last["end"] = max(last["end"], end)
+                last["score"] = max(last["score"], chunk["score"])
+                last["chunks"].append(chunk)
+            else:
+                merged.append({"text": chunk["text"], "score": chunk["score"], "end": end, "chunks": [chunk]})
+        return merged
+
+    def _merge_by_text(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        segments = [{"text": c["text"], "score": c["score"], "chunks": [c]} for c in chunks]
+        merged_any = True
+        while merged_any and len(segments) > 1:
+            merged_any = False
+            for a in range(len(segments)):
+                for b in range(len(segments)):
+                    if a == b:
+                        continue
+                    overlap = self._text_overlap(segments[a]["text"], segments[b]["text"])
+                    if overlap:
+                        segments[a] = {
+                            "text": segments[a]["text"] + segments[b]["text"][overlap:],
+                            "score": max(segments[a]["score"], segments[b]["score"]),
+                            "chunks": segments[a]["chunks"] + segments[b]["chunks"],
+                        }
+                        del segments[b]
+                        merged_any = True
+                        break
+                if merged_any:
+                    break
+        return segments
+
+    def _text_overlap(self, left: str, right: str) -> int:
+        """
+        Length of the longest suffix of `left` that is a prefix of `right`.
+        """
+        limit = min(len(left), len(right), self.MAX_TEXT_OVERLAP)
+        for size in range(limit, self.MIN_TEXT_OVERLAP - 1, -1):
+            if left.endswith(right[:size]):
+                return size
+        return 0
+
+    @staticmethod
+    def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+        words = re.findall(r'\w+', text.lower())
+        if len(words) < size:
+            return {tuple(words)}
+        return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+    @staticmethod
+    def _jaccard(a: Set, b: Set) -> float:
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
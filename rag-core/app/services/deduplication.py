@@ -0,0 +1,78 @@
+import os
+import re
+import zlib
+from typing import Dict, List, Tuple
+import numpy as np
+
+class NearDuplicateFilter:
+    """
+    MinHash + LSH near-duplicate detection for pages and chunks.
+
+    Each text is reduced to word shingles and a MinHash signature; the
+    signature is split into bands and hashed into LSH buckets, so only
+    texts sharing a bucket are compared. A text whose estimated Jaccard
+    similarity to an earlier text reaches the threshold is a duplicate
+    and the earlier one is kept (crawl order puts shallower pages first).
+    """
+
+    # Prime just above 2**32: (a * x) with a, x < 2**32 still fits in uint64
+    _PRIME = np.uint64(4294967311)
+
+    def __init__(self, threshold: float = None, num_perm: int = None, shingle_size: int = None):
+        self.threshold = threshold if threshold is not None else float(os.getenv("DEDUP_SIMILARITY_THRESHOLD", "0.9"))
+        self.num_perm = num_perm or int(os.getenv("DEDUP_NUM_PERM", "64"))
+        self.shingle_size = shingle_size or int(os.getenv("DEDUP_SHINGLE_SIZE", "3"))
+        self.bands, self.rows = self._band_layout(self.threshold, self.num_perm)
+
+        rng = np.random.default_rng(1)
+        self._a = rng.integers(1, 2 ** 32, size=(self.num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 32, size=(self.num_perm, 1), dtype=np.uint64)
+
+    @staticmethod
+    def _band_layout(threshold: float, num_perm: int) -> Tuple[int, int]:
+        # Pick bands x rows whose S-curve midpoint (1/b)^(1/r) is closest to the threshold
+        best = (num_perm, 1)
+        best_error = float("inf")
+        for rows in range(1, num_perm + 1):
+            if num_perm % rows:
+                continue
+            bands = num_perm // rows
+            error = abs((1 / bands) ** (1 / rows) - threshold)
+            if error < best_error:
+                best, best_error = (bands, rows), error
+        return best
+
+    def _shingles(self, text: str) -> np.ndarray:
+        words = re.findall(r"\w+", text.lower())
+        if len(words) <= self.shingle_size:
+            grams = {" ".join(words)}
+        else:
+            grams = {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+        return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = self._shingles(text)
+        # (num_perm, n_shingles) universal hashes, min per permutation
+        permuted = (self._a * hashes[np.newaxis, :] % self._PRIME + self._b) % self._PRIME
+        return permuted.min(axis=1)
+
+    def filter(self, texts: List[str]) -> List[int]:
+        """
+        Returns indices of the texts to keep, in their original order.
+        """
+        buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        signatures: Dict[int, np.ndarray] = {}
+        kept = []
+        for i, text in enumerate(texts):
+            sig = self.signature(text)
+            keys = [(band, sig[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+            candidates = {j for key in keys for j in buckets.get(key, ())}
+            if any(np.mean(signatures[j] == sig) >= self.threshold for j in candidates):
+                continue
+
+            kept.append(i)
+            signatures[i] = sig
+            for key in keys:
+                buckets.setdefault(key, []).append(i)
+        return kept
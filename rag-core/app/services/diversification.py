@@ -0,0 +1,58 @@
+import os
+from typing import Any, Dict, List
+import numpy as np
+
+class MMRDiversifier:
+    """
+    Maximal marginal relevance over re-ranked results.
+
+    Picks results one at a time, trading relevance (the re-rank score,
+    min-max scaled to [0, 1]) against the highest cosine similarity to
+    anything already picked:
+
+        mmr = lambda * relevance - (1 - lambda) * max_similarity
+
+    The pairwise similarity matrix is a single matrix product, and each
+    pick updates the running max-similarity vector in one NumPy operation.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ENABLE_MMR", "false").lower() == "true"
+        # 1.0 = pure relevance (plain re-rank order), 0.0 = pure diversity
+        self.lambda_ = float(os.getenv("MMR_LAMBDA", "0.7"))
+
+    def diversify(self, results: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """
+        Select top_k results from `results` (each with "score" and "vector").
+        Results without a vector are treated as similar to nothing.
+        """
+        if len(results) <= top_k:
+            return results
+
+        scores = np.array([r["score"] for r in results], dtype=np.float32)
+        spread = scores.max() - scores.min()
+        relevance = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+
+        dimension = next((len(r["vector"]) for r in results if r.get("vector") is not None), 0)
+        if dimension == 0:
+            return sorted(results, key=lambda r: r["score"], reverse=True)[:top_k]
+        vectors = np.zeros((len(results), dimension), dtype=np.float32)
+        for i, r in enumerate(results):
+            if r.get("vector") is not None:
+                vectors[i] = r["vector"]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1.0, norms)
+        similarity = vectors @ vectors.T
+
+        selected: List[int] = []
+        max_similarity = np.zeros(len(results), dtype=np.float32)
+        available = np.ones(len(results), dtype=bool)
+        for _ in range(top_k):
+            mmr = self.lambda_ * relevance - (1 - self.lambda_) * max_similarity
+            mmr[~available] = -np.inf
+            best = int(np.argmax(mmr))
+            selected.append(best)
+            available[best] = False
+            np.maximum(max_similarity, similarity[best], out=max_similarity)
+
+        return [results[i] for i in selected]
@@ -1,23 +1,29 @@
 import os
-from typing import List, Dict
+from typing import List, Dict, AsyncIterator, Optional, Tuple
 import datetime
-from langchain_huggingface import HuggingFaceEndpoint, ChatHuggingFace
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from app.services.context_packer import ContextPacker
+from app.services.llm_client import LLMClient
+from app.exceptions import ServiceUnavailableException
 
 class GenerationService:
+    ERROR_MESSAGE = "I'm sorry, I encountered an internal error while generating your answer."
+    DEGRADED_MESSAGE = "I'm unable to reach the language model right now. Here are the most relevant passages I found:"
+    SUMMARY_PROMPT = (
+        "You maintain a running summary of a conversation between a user and Velora AI. "
+        "Update the summary with the new messages. Keep facts about the user (name, preferences, goals), "
+        "open questions and key answers; drop pleasantries. Reply with the summary only, under {max_words} words."
+    )
+
     def __init__(self):
         self.api_token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
         self.model_id = "meta-llama/Llama-3.2-3B-Instruct"
         
-        llm = HuggingFaceEndpoint(
-            repo_id=self.model_id,
-            huggingfacehub_api_token=self.api_token,
-            temperature=0.1,
-            max_new_tokens=1000,
-            timeout=300
-        )
-        self.chat_model = ChatHuggingFace(llm=llm)
+        # Pooled, concurrency-limited client with adaptive timeouts, hedging and circuit breaking
+        self.llm_client = LLMClient.from_env(self.model_id, self.api_token)
+        self.context_packer = ContextPacker(self.model_id, self.api_token)
+        self.summary_max_words = int(os.getenv("SESSION_SUMMARY_MAX_WORDS", "150"))
         
         self.prompt_template = ChatPromptTemplate.from_messages([
             ("system", """
@@ -40,7 +46,7 @@ INSTRUCTIONS:
 
 STRICT RULE: Do NOT output JSON. Provide a natural, readable text response.
 """),
-            MessagesPlaceholder(variable_name="chat_history"),
+            # Conversation history is spliced in between (see _build_prompt)
             ("human", """
 Context:
 {context}
@@ -51,58 +57,114 @@ Question:
         ])
 
 
-    def generate_answer(self, query: str, results: List[Dict], history: List[Dict] = []) -> Dict:
-        if not results:
-            context = "No document context available. This is a general query."
-        else:
-            # Check for greetings or identity questions to avoid context pollution (e.g. "Aseuro")
-            simple_queries = [
-                "hello", "hi", "hey", "greetings", "good morning", "good afternoon", "good evening", 
-                "who are you", "what is your name", "what can you do", "help",
-                "thanks", "thank you", "thx", "ok", "okay", "cool", "great", "sure", "bye", "goodbye"
-            ]
-            cleaned_query = query.lower().strip().rstrip("?!.")
-            
-            if cleaned_query in simple_queries:
-                context = "" # Force empty context to rely on system prompt
-            else:
-                context = "\n\n".join([f"Content: {res.get('text')}" for res in results[:5]])
-        
-        # Convert history dicts to LangChain messages
+    def warm_up(self):
+        # Loads the tokenizer's lazy state and the prompt template code paths
+        self._build_prompt("warm up", [{"text": "warm up", "score": 0.0}], self.format_history([{"role": "user", "content": "warm up"}]))
+
+    def format_history(self, history: List[Dict]) -> List[Dict[str, str]]:
+        """
+        Normalize client-supplied history into OpenAI-style messages, keeping
+        only the most recent turns that fit the history token budget.
+        """
         # history: [{"role": "user", "content": "..."}, {"role": "assistant", "content": "..."}]
-        chat_history = []
-        # Take only last 10 messages for context window stability
-        for msg in history[-10:]:
+        messages = []
+        for msg in history:
             # If the content is a dict (AI summary/extracted_data), extract the summary string
             content = msg.get("content", "")
             if isinstance(content, dict):
                 content = content.get("summary", str(content))
-            
-            if msg.get("role") == "user":
-                chat_history.append(HumanMessage(content=content))
-            else:
-                chat_history.append(AIMessage(content=content))
-                
+            role = "user" if msg.get("role") == "user" else "assistant"
+            messages.append({"role": role, "content": str(content)})
+        return self.context_packer.trim_history(messages)
+
+    def _conversation(self, history: List[Dict], session=None) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """
+        Returns (history messages, rolling summary). For a server-side session
+        the formatted history is cached on the session until it changes.
+        """
+        if session is None:
+            return self.format_history(history), None
+        if session.prompt_prefix is None:
+            session.prompt_prefix = self.format_history(session.messages)
+        return session.prompt_prefix, session.summary
+
+    def _build_prompt(self, query: str, results: List[Dict], history: List[Dict], summary: Optional[str] = None):
+        """
+        `history` is already formatted (see format_history); `summary` is the
+        session's rolling summary of turns no longer sent verbatim.
+        """
+        if not results:
+            # Greetings/identity/meta questions are routed here without retrieval
+            context = "No document context available. This is a general query."
+        else:
+            # Merged, de-duplicated chunks in rerank order, within the prompt token budget
+            context = self.context_packer.pack_context(results)
+        
         # Format prompt
         current_time_str = datetime.datetime.now().strftime("%B %d, %Y at %I:%M:%S %p")
         formatted_prompt = self.prompt_template.invoke({
-            "chat_history": chat_history,
             "context": context,
             "question": query,
             "current_time": current_time_str
         })
+        system, question = self._to_openai_messages(formatted_prompt.to_messages())
+        
+        if summary:
+            system = {"role": "system", "content": f"{system['content']}\nSummary of the earlier conversation:\n{summary}\n"}
+        return [system] + list(history) + [question]
+
+    @staticmethod
+    def _to_openai_messages(messages) -> List[Dict[str, str]]:
+        roles = {SystemMessage: "system", HumanMessage: "user", AIMessage: "assistant"}
+        return [{"role": roles.get(type(m), "user"), "content": m.content} for m in messages]
+
+    def _degraded_answer(self, results: List[Dict]) -> Dict:
+        """
+        Extractive fallback served when no LLM backend is available.
+        """
+        if not results:
+            return {"summary": self.ERROR_MESSAGE, "extracted_data": {}}
+        passages = "\n\n".join(f"- {res.get('text', '').strip()}" for res in results[:3])
+        return {"summary": f"{self.DEGRADED_MESSAGE}\n\n{passages}", "extracted_data": {"degraded": True}}
+
+    async def generate_answer(self, query: str, results: List[Dict], history: List[Dict] = [], session=None) -> Dict:
+        messages = self._build_prompt(query, results, *self._conversation(history, session))
         
         # Generate answer
         try:
-            response = self.chat_model.invoke(formatted_prompt)
-            content = response.content.strip()
+            content = (await self.llm_client.complete(messages)).strip()
             
             return {
                 "summary": content,
                 "extracted_data": {}
             }
             
+        except ServiceUnavailableException as e:
+            print(f"WARNING: GenerationService degraded: {e.message}", flush=True)
+            return self._degraded_answer(results)
         except Exception as e:
             print(f"ERROR in GenerationService: {e}")
-            return {"summary": "I'm sorry, I encountered an internal error while generating your answer.", "extracted_data": {}}
+            return {"summary": self.ERROR_MESSAGE, "extracted_data": {}}
 
+    async def astream_answer(self, query: str, results: List[Dict], history: List[Dict] = [], session=None) -> AsyncIterator[str]:
+        """
+        Stream the answer token by token. Errors propagate to the caller so
+        a failed stream is never mistaken for a complete answer.
+        """
+        messages = self._build_prompt(query, results, *self._conversation(history, session))
+        async for token in self.llm_client.stream(messages):
+            yield token
+
+    async def summarize_history(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        """
+        Fold messages into a conversation summary (used by SessionStore in
+        the background). Raises if no LLM backend is available.
+        """
+        transcript = "\n".join(
+            f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in messages
+        )
+        prompt = [
+            {"role": "system", "content": self.SUMMARY_PROMPT.format(max_words=self.summary_max_words)},
+            {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"},
+        ]
+        return (await self.llm_client.complete(prompt)).strip()
@@ -1,21 +1,22 @@
 import os
+import json
+import time
 import httpx
 import asyncio
 from typing import List, Optional
 from bs4 import BeautifulSoup
-from langchain_community.document_transformers import BeautifulSoupTransformer
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_core.documents import Document
 from langchain_core.documents import Document
 from upstash_vector import Index
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader, CSVLoader
 import tempfile
-from playwright.async_api import async_playwright
 from urllib.parse import urljoin, urlparse
+from app.timing import stage
+from app.services.deduplication import NearDuplicateFilter
+from app.services.sitemap_discovery import SitemapDiscovery
+from app.services.namespace_lifecycle import catalog_is_shared
 
 class IngestionService:
-    def __init__(self):
+    def __init__(self, embeddings=None, catalog=None, chunk_store=None):
         # Load environment variables
         from dotenv import load_dotenv
         load_dotenv()
@@ -36,15 +37,45 @@ class IngestionService:
         )
         
         # Initialize Embedding Model (Local - No API Key Required)
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+        # Pass the retrieval service's instance to avoid loading the model twice
+        if embeddings is None:
+            from langchain_huggingface import HuggingFaceEmbeddings
+            embeddings = HuggingFaceEmbeddings(
+                model_name="sentence-transformers/all-MiniLM-L6-v2"
+            )
+        self.embeddings = embeddings
+        
+        # Optional NamespaceCatalog that tracks vectors for per-namespace eviction
+        self.catalog = catalog
+        # Optional ChunkStore: when set, chunk text is stored locally instead of in vector metadata
+        self.chunk_store = chunk_store
+        # Sweeper TTL (see NamespaceLifecycleManager)
+        self.namespace_ttl = float(os.getenv("NAMESPACE_TTL_SECONDS", str(24 * 60 * 60)))
+        # Upstash-side TTL is only a backstop when the sweeper runs, so it outlives the sweeper's
+        # TTL (2x by default) and the sweeper's gradual, rate-limited expiry happens first.
+        # Without a shared catalog there is no sweeper and it is the only expiry.
+        sweeping = catalog is not None and catalog_is_shared()
+        default_backstop = self.namespace_ttl * 2 if sweeping else self.namespace_ttl
+        self.vector_ttl = int(float(os.getenv("UPSTASH_BACKSTOP_TTL_SECONDS", str(default_backstop))))
+        
+        # Near-duplicate pages and chunks (pagination, tag pages, boilerplate) are dropped before embedding
+        self.enable_dedup = os.getenv("ENABLE_NEAR_DUPLICATE_FILTER", "true").lower() == "true"
+        self.dedup_filter = NearDuplicateFilter()
+        
+        # Recursive crawls discover URLs from robots.txt/sitemaps before falling back to link-following
+        self.enable_sitemap_discovery = os.getenv("ENABLE_SITEMAP_DISCOVERY", "true").lower() == "true"
+        self.sitemap_discovery = SitemapDiscovery()
+        # Pages unchanged since their last crawl are skipped, but still re-fetched
+        # often enough that their vectors are refreshed before the TTL expires them
+        self.recrawl_after = float(os.getenv("CRAWL_RECRAWL_AFTER_SECONDS", str(self.namespace_ttl / 2)))
         
         # Recursive Character Splitting Strategy
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=400,
             chunk_overlap=50,
-            separators=["\n\n", "\n", " ", ""]
+            separators=["\n\n", "\n", " ", ""],
+            # Offsets let the context packer merge adjacent/overlapping chunks
+            add_start_index=True
         )
 
     async def ingest(self, urls: List[str], namespace: str, recursive: bool = False, max_pages: int = 10):
@@ -56,6 +87,19 @@ class IngestionService:
         
         for url in urls:
             await queue.put((url, 0)) # (url, depth)
+        
+        # Hosts whose sitemap listed pages don't need link-following to find them
+        sitemap_hosts = set()
+        skipped_unchanged = 0
+        if recursive and self.enable_sitemap_discovery:
+            with stage("discover"):
+                discovered, sitemap_hosts, skipped_unchanged = await self._discover_from_sitemaps(urls, namespace)
+            for url in discovered[:max(max_pages - len(urls), 0)]:
+                await queue.put((url, 2))
+        crawled_urls = []
+
+        # Imported on first crawl: Playwright is not needed to serve queries
+        from playwright.async_api import async_playwright
 
         async with async_playwright() as p:
             browser = await p.chromium.launch(headless=True)
@@ -90,12 +134,14 @@ class IngestionService:
                         html_content = await page.content()
                         structured_text = self._extract_structured_content(html_content, url)
                         
+                        async with lock:
+                            crawled_urls.append(url)
                         if len(structured_text) >= 50:
                             async with lock:
                                 docs.append(Document(page_content=structured_text, metadata={"source": url}))
                             print(f"DEBUG: Extracted {len(structured_text)} chars from {url}", flush=True)
                         
-                        if recursive and depth < 2:
+                        if recursive and depth < 2 and urlparse(url).netloc not in sitemap_hosts:
                             links = await page.eval_on_selector_all("a[href]", "elements => elements.map(e => e.href)")
                             base_domain = urlparse(url).netloc
                             
@@ -120,10 +166,66 @@ class IngestionService:
             await browser.close()
         
         if not docs:
+            # Pages too thin to index have nothing to re-check before they go stale
+            await self._record_crawls(namespace, crawled_urls)
             print("ERROR: No documents loaded.", flush=True)
             return {"error": "Failed to load any content"}
 
-        return await self._process_and_index(docs, namespace)
+        result = await self._process_and_index(docs, namespace)
+        # Pages whose chunks weren't all written must be fetched again next time
+        failed = set(result["failed_sources"])
+        await self._record_crawls(namespace, [url for url in crawled_urls if url not in failed])
+        result["skipped_unchanged"] = skipped_unchanged
+        return result
+
+    async def _record_crawls(self, namespace: str, urls: List[str]):
+        if self.catalog is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.catalog.record_crawls, namespace, urls)
+
+    async def _discover_from_sitemaps(self, urls: List[str], namespace: str):
+        """
+        Returns (urls to crawl, hosts with a usable sitemap, unchanged pages skipped).
+
+        Discovered URLs are ordered newest `lastmod` first. A page is skipped
+        when its `lastmod` is older than our last crawl of it and that crawl
+        is recent enough (CRAWL_RECRAWL_AFTER_SECONDS).
+        """
+        roots = {}
+        for url in urls:
+            roots.setdefault(urlparse(url).netloc, url)
+        
+        results = await asyncio.gather(
+            *(self.sitemap_discovery.discover(root) for root in roots.values()), return_exceptions=True
+        )
+        entries = []
+        sitemap_hosts = set()
+        for host, result in zip(roots, results):
+            if isinstance(result, Exception):
+                print(f"WARNING: Sitemap discovery failed for {host}: {result}", flush=True)
+                continue
+            if result:
+                sitemap_hosts.add(host)
+                entries.extend(result)
+        
+        crawl_times = {}
+        if self.catalog is not None and entries:
+            loop = asyncio.get_running_loop()
+            crawl_times = await loop.run_in_executor(
+                None, self.catalog.crawl_times, namespace, [url for url, _ in entries]
+            )
+        
+        fresh_after = time.time() - self.recrawl_after
+        discovered = []
+        skipped = 0
+        for url, lastmod in sorted(entries, key=lambda e: e[1] if e[1] is not None else float("-inf"), reverse=True):
+            crawled_at = crawl_times.get(url)
+            if lastmod is not None and crawled_at is not None and lastmod <= crawled_at and crawled_at > fresh_after:
+                skipped += 1
+                continue
+            discovered.append(url)
+        print(f"DEBUG: Sitemaps listed {len(entries)} pages, {skipped} unchanged since last crawl", flush=True)
+        return discovered, sitemap_hosts, skipped
 
     def _extract_structured_content(self, html: str, url: str) -> str:
         soup = BeautifulSoup(html, "html.parser")
@@ -231,6 +333,8 @@ class IngestionService:
         files: List of (filename, file_content)
         """
         print(f"DEBUG: Starting ingestion for {len(files)} files in {namespace}", flush=True)
+        # Imported on first upload: the loaders pull in pypdf/docx parsers
+        from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader, CSVLoader
         all_docs = []
         
         for filename, content in files:
@@ -268,11 +372,30 @@ class IngestionService:
         return await self._process_and_index(all_docs, namespace)
 
     async def _process_and_index(self, docs: List[Document], namespace: str):
+        loop = asyncio.get_running_loop()
+        duplicate_pages = 0
+        if self.enable_dedup:
+            with stage("dedup"):
+                kept = await loop.run_in_executor(None, self.dedup_filter.filter, [doc.page_content for doc in docs])
+            duplicate_pages = len(docs) - len(kept)
+            docs = [docs[i] for i in kept]
+            print(f"DEBUG: Dropped {duplicate_pages} near-duplicate pages", flush=True)
+        
         # 3. Chunking
         print("DEBUG: Chunking documents...", flush=True)
-        chunks = self.text_splitter.split_documents(docs)
+        with stage("chunk"):
+            chunks = self.text_splitter.split_documents(docs)
         print(f"DEBUG: Created {len(chunks)} chunks", flush=True)
         
+        # Chunks repeated across pages (navigation, footers, shared sidebars)
+        duplicate_chunks = 0
+        if self.enable_dedup:
+            with stage("dedup"):
+                kept = await loop.run_in_executor(None, self.dedup_filter.filter, [chunk.page_content for chunk in chunks])
+            duplicate_chunks = len(chunks) - len(kept)
+            chunks = [chunks[i] for i in kept]
+            print(f"DEBUG: Dropped {duplicate_chunks} near-duplicate chunks", flush=True)
+        
         # 4. Preparing for Vector Storage
         # Upstash is serverless, no explicit collection creation needed usually for single index.
         # We will use metadata filtering for namespaces.
@@ -280,6 +403,9 @@ class IngestionService:
         # 5. Indexing
         print(f"DEBUG: Generating embeddings and indexing {len(chunks)} chunks in batches...", flush=True)
         vectors_to_upsert = []
+        texts_by_id = {}
+        # Sources with at least one chunk that was not embedded or upserted
+        failed_sources = set()
         batch_size = 20  # Smaller batch size for Inference API stability
         
         for i in range(0, len(chunks), batch_size):
@@ -293,7 +419,8 @@ class IngestionService:
             while retry_count < max_retries:
                 try:
                     loop = asyncio.get_running_loop()
-                    batch_vectors = await loop.run_in_executor(None, self.embeddings.embed_documents, batch_texts)
+                    with stage("embed"):
+                        batch_vectors = await loop.run_in_executor(None, self.embeddings.embed_documents, batch_texts)
                     break
                 except Exception as e:
                     retry_count += 1
@@ -306,23 +433,28 @@ class IngestionService:
                     chunk = batch[j]
                     source = chunk.metadata.get('source', 'unknown')
                     import uuid
-                    chunk_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, chunk.page_content + source))
+                    # Namespace is part of the ID so tenants never overwrite each other's vectors
+                    chunk_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{namespace}:{source}:{chunk.page_content}"))
                     
                     # Add namespace to metadata for filtering
                     metadata = chunk.metadata.copy()
-                    metadata["text"] = chunk.page_content
+                    if self.chunk_store is None:
+                        metadata["text"] = chunk.page_content
                     metadata["namespace"] = namespace
                     metadata["url"] = source
                     
-                    # Use dictionary format to include TTL (86400 seconds = 24 hours)
+                    texts_by_id[chunk_id] = chunk.page_content
+                    
+                    # Use dictionary format to include the backstop TTL (UPSTASH_BACKSTOP_TTL_SECONDS)
                     vectors_to_upsert.append({
                         "id": chunk_id,
                         "vector": vector,
                         "metadata": metadata,
-                        "ttl": 86400  # 24-hour retention
+                        "ttl": self.vector_ttl
                     })
             else:
                 print(f"ERROR: Failed to embed batch starting at index {i} after {max_retries} retries.", flush=True)
+                failed_sources.update(chunk.metadata.get('source', 'unknown') for chunk in batch)
 
         if vectors_to_upsert:
             print(f"DEBUG: Upserting {len(vectors_to_upsert)} vectors to Upstash...", flush=True)
@@ -334,11 +466,36 @@ class IngestionService:
                 try:
                     # Upstash sync client, run in executor if needed but it's fast http
                     loop = asyncio.get_running_loop()
-                    await loop.run_in_executor(None, self.index.upsert, batch)
+                    if self.chunk_store is not None:
+                        # Text first, so a vector is never searchable without its body
+                        # Vectors are kept too (quantized) when CHUNK_STORE_VECTOR_DTYPE is set
+                        await loop.run_in_executor(
+                            None,
+                            self.chunk_store.put_many,
+                            namespace,
+                            [(v["id"], texts_by_id[v["id"]]) for v in batch],
+                            [v["vector"] for v in batch],
+                        )
+                    with stage("vector_upsert"):
+                        await loop.run_in_executor(None, self.index.upsert, batch)
+                    if self.catalog is not None:
+                        await loop.run_in_executor(
+                            None, self.catalog.record_vectors, namespace, [(v["id"], self._vector_size(v)) for v in batch]
+                        )
                 except Exception as e:
                      print(f"ERROR: Upstash upsert failed: {e}", flush=True)
+                     failed_sources.update(v["metadata"]["url"] for v in batch)
             
-        return {"chunks_indexed": len(chunks)}
+        return {
+            "chunks_indexed": len(chunks),
+            "duplicates_removed": {"pages": duplicate_pages, "chunks": duplicate_chunks},
+            "failed_sources": sorted(failed_sources)
+        }
+
+    @staticmethod
+    def _vector_size(vector: dict) -> int:
+        # float32 payload plus serialized metadata, as stored by the index
+        return len(vector["vector"]) * 4 + len(json.dumps(vector["metadata"], default=str))
 
     async def reset_database(self):
         """
@@ -348,6 +505,10 @@ class IngestionService:
         try:
             loop = asyncio.get_running_loop()
             await loop.run_in_executor(None, self.index.reset)
+            if self.catalog is not None:
+                await loop.run_in_executor(None, self.catalog.clear)
+            if self.chunk_store is not None:
+                await loop.run_in_executor(None, self.chunk_store.clear)
             print("DEBUG: Database reset successfully.", flush=True)
             return True
         except Exception as e:
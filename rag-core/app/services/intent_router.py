@@ -0,0 +1,130 @@
+import os
+import re
+import asyncio
+from typing import List, Dict, Any, Optional
+import numpy as np
+
+class IntentRouter:
+    """
+    Fast intent classification that runs before retrieval.
+
+    Greetings, identity and meta questions never need document context, so
+    they skip query expansion, embedding search and re-ranking entirely.
+    Classification is a lexicon lookup first, then a nearest-prototype
+    check against precomputed embeddings for short queries.
+    """
+
+    ROUTE_RETRIEVE = "retrieve"
+    ROUTE_GENERATE = "generate"
+    ROUTE_CANNED = "canned"
+
+    # Exact (normalized) phrases per intent
+    LEXICON = {
+        "greeting": ["hello", "hi", "hey", "hii", "hello there", "hi there", "greetings",
+                     "good morning", "good afternoon", "good evening"],
+        "identity": ["who are you", "what is your name", "whats your name", "who created you",
+                     "who made you", "who is your developer", "who built you", "are you a bot"],
+        "meta": ["what can you do", "how can you help", "how can you help me", "help",
+                 "what do you do", "what are your capabilities"],
+        "gratitude": ["thanks", "thank you", "thx", "thank you so much", "thanks a lot", "ty"],
+        "farewell": ["bye", "goodbye", "see you", "see you later", "good night"],
+        "acknowledgement": ["ok", "okay", "cool", "great", "sure", "got it", "nice", "alright"],
+    }
+
+    # Example utterances used to build the prototype vectors
+    PROTOTYPES = {
+        "greeting": ["hello", "hey there, how are you", "good morning to you", "hi, nice to meet you"],
+        "identity": ["who are you", "tell me about yourself", "what is your name", "who developed you"],
+        "meta": ["what can you do", "how can you help me", "what are you able to answer", "what kind of questions can I ask"],
+        "gratitude": ["thank you", "thanks a lot for your help", "much appreciated", "thanks, that helped"],
+        "farewell": ["goodbye", "bye, see you later", "talk to you later", "have a nice day"],
+        "acknowledgement": ["okay", "got it", "sounds good", "alright, cool"],
+    }
+
+    ROUTES = {
+        "greeting": ROUTE_GENERATE,
+        "identity": ROUTE_GENERATE,
+        "meta": ROUTE_GENERATE,
+        "gratitude": ROUTE_CANNED,
+        "farewell": ROUTE_CANNED,
+        "acknowledgement": ROUTE_CANNED,
+    }
+
+    CANNED_RESPONSES = {
+        "gratitude": "You're very welcome! Let me know if there is anything else I can help you with.",
+        "farewell": "Goodbye! Feel free to come back anytime you have more questions.",
+        "acknowledgement": "Great! Let me know if you have any other questions.",
+    }
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.enabled = os.getenv("ENABLE_INTENT_ROUTER", "true").lower() == "true"
+        self.threshold = float(os.getenv("INTENT_SIMILARITY_THRESHOLD", "0.8"))
+        # Longer queries are almost always knowledge questions; don't spend an embedding on them
+        self.max_words = int(os.getenv("INTENT_MAX_WORDS", "8"))
+
+        self.lexicon = {
+            phrase: intent for intent, phrases in self.LEXICON.items() for phrase in phrases
+        }
+        self._prototype_labels: List[str] = []
+        self._prototype_matrix: Optional[np.ndarray] = None
+        if self.enabled:
+            self._build_prototypes()
+
+    def _build_prototypes(self):
+        texts = []
+        for intent, examples in self.PROTOTYPES.items():
+            for example in examples:
+                texts.append(example)
+                self._prototype_labels.append(intent)
+        self._prototype_matrix = self._normalize(np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32))
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        cleaned = re.sub(r"[^\w\s']", " ", query.lower()).replace("'", "")
+        return " ".join(cleaned.split())
+
+    def classify(self, query: str) -> Dict[str, Any]:
+        """
+        Classify a query into an intent and route.
+
+        Args:
+            query: Raw user query
+
+        Returns:
+            Dict with 'intent', 'route', 'confidence' and, when the embedding
+            classifier ran, the 'query_vector' so retrieval can reuse it
+        """
+        result = {"intent": "knowledge", "route": self.ROUTE_RETRIEVE, "confidence": 0.0, "query_vector": None}
+        if not self.enabled:
+            return result
+
+        normalized = self.normalize_query(query)
+        intent = self.lexicon.get(normalized)
+        if intent:
+            return {"intent": intent, "route": self.ROUTES[intent], "confidence": 1.0, "query_vector": None}
+
+        if not normalized or len(normalized.split()) > self.max_words:
+            return result
+
+        query_vector = self.embeddings.embed_query(query)
+        result["query_vector"] = query_vector
+        similarities = self._prototype_matrix @ self._normalize(np.asarray(query_vector, dtype=np.float32))
+        best = int(np.argmax(similarities))
+        confidence = float(similarities[best])
+        if confidence >= self.threshold:
+            intent = self._prototype_labels[best]
+            result.update({"intent": intent, "route": self.ROUTES[intent], "confidence": confidence})
+        return result
+
+    async def route(self, query: str) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.classify, query)
+
+    def canned_response(self, intent: str) -> Dict[str, Any]:
+        return {"summary": self.CANNED_RESPONSES[intent], "extracted_data": {}}
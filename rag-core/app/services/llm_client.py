@@ -0,0 +1,366 @@
+import os
+import json
+import time
+import hashlib
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Dict, List, Optional
+import httpx
+from app.exceptions import ServiceUnavailableException
+
+class LatencyTracker:
+    """
+    Rolling window of successful call latencies (seconds).
+    """
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+class CircuitBreaker:
+    """
+    Opens after consecutive failures so callers fail fast instead of waiting
+    on a degraded backend. After the reset timeout a single trial call is
+    let through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def is_open(self) -> bool:
+        """
+        True while calls would be rejected (side-effect free, unlike allow).
+        """
+        return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        # A cancelled half-open trial proves nothing either way
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+class LLMBackend:
+    """
+    One OpenAI-compatible chat completions endpoint with its own
+    concurrency limit, latency statistics and circuit breaker.
+    """
+
+    def __init__(self, name: str, base_url: str, model: str, api_key: Optional[str] = None,
+                 max_concurrency: int = 8, breaker_failures: int = 5, breaker_reset_seconds: float = 30.0):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset_seconds)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+class LLMClient:
+    """
+    Resilient client for OpenAI-compatible chat completion backends.
+
+    - pooled async HTTP transport shared by all calls
+    - per-backend concurrency semaphore (bounded queue wait)
+    - adaptive timeouts derived from observed latency percentiles
+    - optional hedged request to the secondary backend
+    - per-backend circuit breakers, with the last good response for an
+      identical conversation served when every backend is unavailable
+    """
+
+    def __init__(self, backends: List[LLMBackend], temperature: float = 0.1, max_tokens: int = 1000):
+        if not backends:
+            raise ValueError("LLMClient requires at least one backend")
+        self.backends = backends
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+        self.queue_timeout = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+        self.timeout_min = float(os.getenv("LLM_TIMEOUT_MIN_SECONDS", "10"))
+        self.timeout_max = float(os.getenv("LLM_TIMEOUT_MAX_SECONDS", "60"))
+        self.timeout_factor = float(os.getenv("LLM_TIMEOUT_P99_FACTOR", "2.0"))
+        self.enable_hedging = os.getenv("LLM_ENABLE_HEDGING", "false").lower() == "true"
+        self.hedge_percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+        self.fallback_cache_size = int(os.getenv("LLM_FALLBACK_CACHE_SIZE", "256"))
+
+        self._fallback_cache: "OrderedDict[str, str]" = OrderedDict()
+        # Created lazily so the client binds to the serving event loop (and survives pre-fork)
+        self._http: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def from_env(cls, default_model: str, default_api_key: Optional[str] = None) -> "LLMClient":
+        max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+        breaker_failures = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+        breaker_reset = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+        backends = [LLMBackend(
+            "primary",
+            os.getenv("LLM_BASE_URL", "https://router.huggingface.co/v1"),
+            os.getenv("LLM_MODEL", default_model),
+            os.getenv("LLM_API_KEY", default_api_key),
+            max_concurrency, breaker_failures, breaker_reset,
+        )]
+        secondary_url = os.getenv("LLM_SECONDARY_BASE_URL")
+        if secondary_url:
+            backends.append(LLMBackend(
+                "secondary",
+                secondary_url,
+                os.getenv("LLM_SECONDARY_MODEL", default_model),
+                os.getenv("LLM_SECONDARY_API_KEY", default_api_key),
+                max_concurrency, breaker_failures, breaker_reset,
+            ))
+        return cls(
+            backends,
+            temperature=float(os.getenv("LLM_TEMPERATURE", "0.1")),
+            max_tokens=int(os.getenv("LLM_MAX_NEW_TOKENS", "1000")),
+        )
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                timeout=httpx.Timeout(self.timeout_max, connect=5.0),
+            )
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def _timeout(self, backend: LLMBackend) -> float:
+        # Until enough samples exist, allow the full budget
+        if len(backend.latency.samples) < 20:
+            return self.timeout_max
+        p99 = backend.latency.percentile(99)
+        return min(self.timeout_max, max(self.timeout_min, p99 * self.timeout_factor))
+
+    def _payload(self, backend: LLMBackend, messages: List[Dict[str, str]], stream: bool) -> Dict[str, Any]:
+        return {
+            "model": backend.model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stream": stream,
+        }
+
+    @staticmethod
+    def _fallback_key(messages: List[Dict[str, str]]) -> str:
+        # The system prompt embeds the current time, so only the conversation is keyed
+        conversation = [m for m in messages if m["role"] != "system"]
+        return hashlib.sha1(json.dumps(conversation, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _remember(self, messages: List[Dict[str, str]], text: str):
+        key = self._fallback_key(messages)
+        self._fallback_cache[key] = text
+        self._fallback_cache.move_to_end(key)
+        while len(self._fallback_cache) > self.fallback_cache_size:
+            self._fallback_cache.popitem(last=False)
+
+    async def _acquire(self, backend: LLMBackend):
+        try:
+            await asyncio.wait_for(backend.semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise ServiceUnavailableException(f"LLM backend '{backend.name}' is saturated")
+
+    async def _call(self, backend: LLMBackend, messages: List[Dict[str, str]]) -> str:
+        # Queue first: a half-open trial is only taken once the call can actually run,
+        # so a queue timeout or cancellation while waiting never strands it
+        await self._acquire(backend)
+        if not backend.breaker.allow():
+            backend.semaphore.release()
+            raise ServiceUnavailableException(f"LLM backend '{backend.name}' circuit is open")
+
+        start = time.monotonic()
+        try:
+            response = await self.http.post(
+                f"{backend.base_url}/chat/completions",
+                json=self._payload(backend, messages, stream=False),
+                headers=backend.headers,
+                timeout=self._timeout(backend),
+            )
+            response.raise_for_status()
+            text = response.json()["choices"][0]["message"]["content"]
+        except asyncio.CancelledError:
+            # Lost a hedge race; neither a success nor a backend failure
+            backend.breaker.release_trial()
+            raise
+        except Exception:
+            backend.breaker.record_failure()
+            raise
+        finally:
+            backend.semaphore.release()
+
+        backend.latency.record(time.monotonic() - start)
+        backend.breaker.record_success()
+        return text
+
+    async def _hedged_call(self, primary: LLMBackend, secondary: LLMBackend, messages: List[Dict[str, str]]) -> str:
+        hedge_delay = primary.latency.percentile(self.hedge_percentile) or self.timeout_min
+        tasks = [asyncio.ensure_future(self._call(primary, messages))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done or tasks[0].exception() is not None:
+                print(f"DEBUG: LLM primary slow or failing after {hedge_delay:.2f}s, hedging to {secondary.name}", flush=True)
+                tasks.append(asyncio.ensure_future(self._call(secondary, messages)))
+
+            last_error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def complete(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Run a chat completion with fallback across backends.
+
+        Args:
+            messages: OpenAI-style [{"role", "content"}] messages
+
+        Returns:
+            The generated text
+
+        Raises:
+            ServiceUnavailableException: every backend failed or is circuit-open
+            and no previous answer exists for this conversation
+        """
+        available = [b for b in self.backends if not b.breaker.is_open()]
+        errors = []
+        try:
+            if self.enable_hedging and len(available) > 1:
+                text = await self._hedged_call(available[0], available[1], messages)
+                self._remember(messages, text)
+                return text
+
+            for backend in available:
+                try:
+                    text = await self._call(backend, messages)
+                    self._remember(messages, text)
+                    return text
+                except Exception as e:
+                    print(f"WARNING: LLM backend '{backend.name}' failed: {e}", flush=True)
+                    errors.append(e)
+        except Exception as e:
+            errors.append(e)
+
+        cached = self._fallback_cache.get(self._fallback_key(messages))
+        if cached is not None:
+            print("WARNING: All LLM backends unavailable, serving cached answer", flush=True)
+            return cached
+        raise ServiceUnavailableException(f"All LLM backends unavailable: {errors[-1] if errors else 'circuit open'}")
+
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """
+        Stream a chat completion. Fails over to the next backend only if no
+        token has been produced yet; streams are not hedged.
+        """
+        last_error: Optional[BaseException] = None
+        for backend in self.backends:
+            if backend.breaker.is_open():
+                continue
+            # Queue before taking a half-open trial (see _call)
+            try:
+                await self._acquire(backend)
+            except ServiceUnavailableException as e:
+                print(f"WARNING: {e.message}", flush=True)
+                last_error = e
+                continue
+            if not backend.breaker.allow():
+                backend.semaphore.release()
+                continue
+            start = time.monotonic()
+            produced = []
+            try:
+                async with self.http.stream(
+                    "POST",
+                    f"{backend.base_url}/chat/completions",
+                    json=self._payload(backend, messages, stream=True),
+                    headers=backend.headers,
+                    timeout=self._timeout(backend),
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        choices = json.loads(data).get("choices") or [{}]
+                        token = (choices[0].get("delta") or {}).get("content")
+                        if token:
+                            produced.append(token)
+                            yield token
+            except (asyncio.CancelledError, GeneratorExit):
+                # Client went away mid-stream; neither a success nor a backend failure
+                backend.breaker.release_trial()
+                raise
+            except Exception as e:
+                backend.breaker.record_failure()
+                if produced:
+                    raise
+                print(f"WARNING: LLM backend '{backend.name}' stream failed: {e}", flush=True)
+                last_error = e
+                continue
+            finally:
+                backend.semaphore.release()
+
+            backend.latency.record(time.monotonic() - start)
+            backend.breaker.record_success()
+            self._remember(messages, "".join(produced))
+            return
+
+        cached = self._fallback_cache.get(self._fallback_key(messages))
+        if cached is not None:
+            yield cached
+            return
+        raise ServiceUnavailableException(f"All LLM backends unavailable: {last_error or 'circuit open'}")
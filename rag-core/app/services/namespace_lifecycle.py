@@ -0,0 +1,355 @@
+import os
+import time
+import socket
+import sqlite3
+import asyncio
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+def catalog_is_shared() -> bool:
+    """
+    Whether every replica writes to this catalog (NAMESPACE_CATALOG_SHARED).
+
+    Vector IDs are deterministic, so replicas share vectors. A sweeper
+    reading a catalog local to one replica would delete vectors that
+    another replica has just re-ingested, so it only runs when the catalog
+    is shared (one replica, or DATA_DIR on a volume all replicas mount).
+    """
+    return os.getenv("NAMESPACE_CATALOG_SHARED", "false").lower() == "true"
+
+class NamespaceCatalog:
+    """
+    Local SQLite catalog of indexed vectors per namespace.
+
+    Tracks vector IDs, approximate sizes and ingest times so namespaces can
+    be expired or trimmed incrementally instead of wiping the whole index.
+    SQLite in WAL mode lets every worker process record ingests safely.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        data_dir = os.getenv("DATA_DIR", "data")
+        self.path = path or os.path.join(data_dir, "catalog.db")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS namespaces (
+                    namespace TEXT PRIMARY KEY,
+                    vector_count INTEGER NOT NULL DEFAULT 0,
+                    size_bytes INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_ingest_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS namespace_vectors (
+                    vector_id TEXT PRIMARY KEY,
+                    namespace TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    ingested_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_vectors_namespace_age
+                    ON namespace_vectors (namespace, ingested_at);
+                CREATE INDEX IF NOT EXISTS idx_vectors_age
+                    ON namespace_vectors (ingested_at);
+                CREATE TABLE IF NOT EXISTS crawled_pages (
+                    namespace TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    crawled_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, url)
+                );
+                CREATE TABLE IF NOT EXISTS namespace_generations (
+                    namespace TEXT PRIMARY KEY,
+                    generation INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    holder TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+            """)
+
+    @contextmanager
+    def _connect(self):
+        # Short-lived connections: calls come from executor threads in several processes
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _refresh_stats(self, conn: sqlite3.Connection, namespaces):
+        for namespace in set(namespaces):
+            count, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM namespace_vectors WHERE namespace = ?",
+                (namespace,),
+            ).fetchone()
+            if count == 0:
+                conn.execute("DELETE FROM namespaces WHERE namespace = ?", (namespace,))
+            else:
+                conn.execute(
+                    "UPDATE namespaces SET vector_count = ?, size_bytes = ? WHERE namespace = ?",
+                    (count, size, namespace),
+                )
+
+    def record_vectors(self, namespace: str, vectors: List[Tuple[str, int]]):
+        """
+        Record upserted vectors as (vector_id, size_bytes) for a namespace.
+        """
+        if not vectors:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO namespaces (namespace, created_at, last_ingest_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(namespace) DO UPDATE SET last_ingest_at = excluded.last_ingest_at",
+                (namespace, now, now),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO namespace_vectors (vector_id, namespace, size_bytes, ingested_at) "
+                "VALUES (?, ?, ?, ?)",
+                [(vector_id, namespace, size, now) for vector_id, size in vectors],
+            )
+            self._refresh_stats(conn, [namespace])
+
+    def remove_vectors(self, vector_ids: List[str]):
+        if not vector_ids:
+            return
+        with self._connect() as conn:
+            placeholders = ",".join("?" * len(vector_ids))
+            namespaces = [row[0] for row in conn.execute(
+                f"SELECT DISTINCT namespace FROM namespace_vectors WHERE vector_id IN ({placeholders})",
+                vector_ids,
+            )]
+            conn.execute(f"DELETE FROM namespace_vectors WHERE vector_id IN ({placeholders})", vector_ids)
+            self._refresh_stats(conn, namespaces)
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM namespace_vectors")
+            conn.execute("DELETE FROM namespaces")
+            conn.execute("DELETE FROM crawled_pages")
+
+    def record_crawls(self, namespace: str, urls: List[str]):
+        """
+        Remember when pages were last fetched, for incremental re-crawls.
+        """
+        if not urls:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO crawled_pages (namespace, url, crawled_at) VALUES (?, ?, ?)",
+                [(namespace, url, now) for url in urls],
+            )
+
+    def crawl_times(self, namespace: str, urls: List[str]) -> Dict[str, float]:
+        """
+        Last fetch time per URL; URLs never crawled are omitted.
+        """
+        times: Dict[str, float] = {}
+        with self._connect() as conn:
+            for i in range(0, len(urls), 500):
+                batch = urls[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                for url, crawled_at in conn.execute(
+                    f"SELECT url, crawled_at FROM crawled_pages WHERE namespace = ? AND url IN ({placeholders})",
+                    [namespace] + batch,
+                ):
+                    times[url] = crawled_at
+        return times
+
+    def bump_generation(self, namespace: str) -> int:
+        """
+        Mark a namespace as re-ingested so every worker drops its cached answers.
+        Returns the new generation.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO namespace_generations (namespace, generation) VALUES (?, 1) "
+                "ON CONFLICT(namespace) DO UPDATE SET generation = generation + 1",
+                (namespace,),
+            )
+            return conn.execute(
+                "SELECT generation FROM namespace_generations WHERE namespace = ?", (namespace,)
+            ).fetchone()[0]
+
+    def generations(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT namespace, generation FROM namespace_generations"))
+
+    def list_namespaces(self) -> List[Dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT namespace, vector_count, size_bytes, created_at, last_ingest_at "
+                "FROM namespaces ORDER BY last_ingest_at DESC"
+            ).fetchall()
+        return [
+            {
+                "namespace": row[0],
+                "vector_count": row[1],
+                "size_bytes": row[2],
+                "created_at": row[3],
+                "last_ingest_at": row[4],
+            }
+            for row in rows
+        ]
+
+    def expired_vectors(self, older_than: float, limit: int) -> List[Tuple[str, str]]:
+        """
+        Oldest (vector_id, namespace) pairs ingested before `older_than`.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT vector_id, namespace FROM namespace_vectors WHERE ingested_at < ? ORDER BY ingested_at LIMIT ?",
+                (older_than, limit),
+            ).fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    def oldest_vectors(self, namespace: str, limit: int) -> List[str]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT vector_id FROM namespace_vectors WHERE namespace = ? ORDER BY ingested_at LIMIT ?",
+                (namespace, limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def acquire_lease(self, name: str, holder: str, duration: float) -> bool:
+        """
+        Take or renew a named lease. Only the holder of an unexpired lease
+        gets True, so exactly one worker process runs the sweeper.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+                "WHERE leases.expires_at < ? OR leases.holder = excluded.holder",
+                (name, holder, now + duration, now),
+            )
+            row = conn.execute("SELECT holder FROM leases WHERE name = ?", (name,)).fetchone()
+        return row is not None and row[0] == holder
+
+class NamespaceLifecycleManager:
+    """
+    Incremental, per-namespace replacement for the global index wipe.
+
+    Each sweep expires vectors not re-ingested within the TTL, trims
+    namespaces over their vector quota (oldest vectors first) and, if the
+    whole index is over its cap, trims the least recently ingested
+    namespaces. Deletes are batched and rate-limited, and a sweep deletes
+    at most a fixed budget, so a large tenant is drained over several
+    sweeps instead of being dropped and re-ingested all at once.
+    """
+
+    LEASE_NAME = "namespace-sweeper"
+
+    def __init__(self, index, catalog: NamespaceCatalog, chunk_store=None):
+        self.index = index
+        self.catalog = catalog
+        self.chunk_store = chunk_store
+        self.ttl_seconds = float(os.getenv("NAMESPACE_TTL_SECONDS", str(24 * 60 * 60)))
+        self.max_vectors_per_namespace = int(os.getenv("NAMESPACE_MAX_VECTORS", "0"))
+        self.max_total_vectors = int(os.getenv("INDEX_MAX_VECTORS", "0"))
+        self.sweep_interval = float(os.getenv("NAMESPACE_SWEEP_INTERVAL_SECONDS", "300"))
+        self.delete_batch_size = int(os.getenv("NAMESPACE_DELETE_BATCH_SIZE", "100"))
+        self.delete_batches_per_second = float(os.getenv("NAMESPACE_DELETE_BATCHES_PER_SECOND", "2"))
+        self.max_deletes_per_sweep = int(os.getenv("NAMESPACE_MAX_DELETES_PER_SWEEP", "5000"))
+
+    @property
+    def holder(self) -> str:
+        # Not fixed at construction: the manager is built in the gunicorn
+        # master, and forked workers must not share its PID as lease holder
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    async def run_forever(self):
+        print(f"INFO: Namespace sweeper running every {self.sweep_interval}s (TTL {self.ttl_seconds}s).", flush=True)
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"ERROR: Namespace sweep failed: {e}", flush=True)
+
+    def _plan(self) -> Dict[str, List[str]]:
+        budget = self.max_deletes_per_sweep
+        plan: Dict[str, List[str]] = {"expired": [], "namespace_quota": [], "index_quota": []}
+        planned = set()
+        # Vectors already planned per namespace, so quotas aren't over-trimmed
+        planned_per_namespace: Dict[str, int] = {}
+
+        def take(reason: str, namespace: str, vector_ids: List[str]):
+            nonlocal budget
+            for vector_id in vector_ids[:max(budget, 0)]:
+                planned.add(vector_id)
+                plan[reason].append(vector_id)
+                planned_per_namespace[namespace] = planned_per_namespace.get(namespace, 0) + 1
+                budget -= 1
+
+        def oldest_unplanned(namespace: str, count: int) -> List[str]:
+            candidates = self.catalog.oldest_vectors(namespace, count + planned_per_namespace.get(namespace, 0))
+            return [vid for vid in candidates if vid not in planned][:count]
+
+        for vector_id, namespace in self.catalog.expired_vectors(time.time() - self.ttl_seconds, budget):
+            take("expired", namespace, [vector_id])
+
+        namespaces = self.catalog.list_namespaces()
+        if self.max_vectors_per_namespace > 0:
+            for ns in namespaces:
+                if budget <= 0:
+                    break
+                remaining = ns["vector_count"] - planned_per_namespace.get(ns["namespace"], 0)
+                excess = remaining - self.max_vectors_per_namespace
+                if excess > 0:
+                    take("namespace_quota", ns["namespace"], oldest_unplanned(ns["namespace"], min(excess, budget)))
+
+        if self.max_total_vectors > 0:
+            excess = sum(ns["vector_count"] for ns in namespaces) - len(planned) - self.max_total_vectors
+            # Least recently ingested namespaces give up vectors first
+            for ns in reversed(namespaces):
+                if excess <= 0 or budget <= 0:
+                    break
+                victims = oldest_unplanned(ns["namespace"], min(excess, budget))
+                take("index_quota", ns["namespace"], victims)
+                excess -= len(victims)
+
+        return plan
+
+    async def sweep(self) -> Dict[str, int]:
+        """
+        Run one eviction pass if this process holds the sweeper lease.
+
+        Returns:
+            Count of deleted vectors per eviction reason
+        """
+        loop = asyncio.get_running_loop()
+        has_lease = await loop.run_in_executor(
+            None, self.catalog.acquire_lease, self.LEASE_NAME, self.holder, self.sweep_interval * 2
+        )
+        if not has_lease:
+            return {}
+
+        plan = await loop.run_in_executor(None, self._plan)
+        stats = {}
+        for reason, vector_ids in plan.items():
+            stats[reason] = await self._delete(vector_ids)
+        if any(stats.values()):
+            print(f"INFO: Namespace sweep deleted vectors: {stats}", flush=True)
+        return stats
+
+    async def _delete(self, vector_ids: List[str]) -> int:
+        loop = asyncio.get_running_loop()
+        deleted = 0
+        for i in range(0, len(vector_ids), self.delete_batch_size):
+            batch = vector_ids[i:i + self.delete_batch_size]
+            try:
+                await loop.run_in_executor(None, lambda: self.index.delete(ids=batch))
+                if self.chunk_store is not None:
+                    await loop.run_in_executor(None, self.chunk_store.delete_many, batch)
+                await loop.run_in_executor(None, self.catalog.remove_vectors, batch)
+                deleted += len(batch)
+            except Exception as e:
+                # Leave them in the catalog; the next sweep retries
+                print(f"ERROR: Failed to delete {len(batch)} vectors: {e}", flush=True)
+            # Rate limit so eviction never competes with query traffic
+            await asyncio.sleep(1 / self.delete_batches_per_second)
+        return deleted
@@ -0,0 +1,58 @@
+"""
+Compact binary encodings for embedding matrices.
+
+All encodings are little-endian and row-major:
+
+- float32: dim x <f4 per row
+- float16: dim x <f2 per row
+- int8:    one <f4 scale followed by dim x int8 per row, where
+           value ~= int8 * scale (symmetric per-row quantization)
+"""
+import numpy as np
+
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+
+def row_nbytes(dtype: str, dim: int) -> int:
+    if dtype == "float32":
+        return 4 * dim
+    if dtype == "float16":
+        return 2 * dim
+    if dtype == "int8":
+        return 4 + dim
+    raise ValueError(f"Unsupported embedding dtype '{dtype}', expected one of {SUPPORTED_DTYPES}")
+
+def quantize(matrix: np.ndarray, dtype: str) -> bytes:
+    """
+    Encode a (rows, dim) float matrix as bytes in the given dtype.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[np.newaxis, :]
+    if dtype == "float32":
+        return matrix.astype("<f4", copy=False).tobytes()
+    if dtype == "float16":
+        return matrix.astype("<f2").tobytes()
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.clip(np.rint(matrix / scales[:, np.newaxis]), -127, 127).astype(np.int8)
+        rows = np.empty((matrix.shape[0], row_nbytes("int8", matrix.shape[1])), dtype=np.uint8)
+        rows[:, :4] = scales.astype("<f4").view(np.uint8).reshape(-1, 4)
+        rows[:, 4:] = quantized.view(np.uint8)
+        return rows.tobytes()
+    raise ValueError(f"Unsupported embedding dtype '{dtype}', expected one of {SUPPORTED_DTYPES}")
+
+def dequantize(buffer: bytes, dtype: str, dim: int) -> np.ndarray:
+    """
+    Decode bytes produced by `quantize` back into a (rows, dim) float32 matrix.
+    """
+    if dtype == "float32":
+        return np.frombuffer(buffer, dtype="<f4").reshape(-1, dim)
+    if dtype == "float16":
+        return np.frombuffer(buffer, dtype="<f2").reshape(-1, dim).astype(np.float32)
+    if dtype == "int8":
+        rows = np.frombuffer(buffer, dtype=np.uint8).reshape(-1, row_nbytes("int8", dim))
+        scales = rows[:, :4].copy().view("<f4").reshape(-1)
+        values = rows[:, 4:].view(np.int8).astype(np.float32)
+        return values * scales[:, np.newaxis]
+    raise ValueError(f"Unsupported embedding dtype '{dtype}', expected one of {SUPPORTED_DTYPES}")
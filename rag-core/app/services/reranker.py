@@ -1,6 +1,5 @@
 import os
 from typing import List, Dict, Any
-from sentence_transformers import CrossEncoder
 
 class Reranker:
     """
@@ -11,6 +10,7 @@ class Reranker:
     
     def __init__(self):
         # Use a lightweight cross-encoder model
+        from sentence_transformers import CrossEncoder
         model_name = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
         self.model = CrossEncoder(model_name)
         self.enabled = os.getenv("ENABLE_RERANKING", "true").lower() == "true"
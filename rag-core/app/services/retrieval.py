@@ -1,13 +1,17 @@
 import os
-from typing import List, Optional
+import re
+import time
+from typing import List, Optional, Union
 import asyncio
-from langchain_huggingface import HuggingFaceEmbeddings
+import numpy as np
 from upstash_vector import Index
 from app.services.query_expander import QueryExpander
 from app.services.reranker import Reranker
+from app.services.diversification import MMRDiversifier
+from app.timing import stage, record_stage
 
 class RetrievalService:
-    def __init__(self):
+    def __init__(self, chunk_store=None):
         # Load environment variables
         from dotenv import load_dotenv
         load_dotenv()
@@ -26,6 +30,8 @@ class RetrievalService:
         )
         
         # Initialize same Embedding Model (Local - No API Key Required)
+        # Imported here: torch/sentence-transformers dominate import time
+        from langchain_huggingface import HuggingFaceEmbeddings
         self.embeddings = HuggingFaceEmbeddings(
             model_name="sentence-transformers/all-MiniLM-L6-v2"
         )
@@ -33,70 +39,244 @@ class RetrievalService:
         # Initialize query expander and reranker
         self.query_expander = QueryExpander()
         self.reranker = Reranker()
+        # Optional MMR pass after re-ranking (needs candidate vectors)
+        self.diversifier = MMRDiversifier()
         
         self.enable_expansion = os.getenv("ENABLE_QUERY_EXPANSION", "true").lower() == "true"
+        
+        # Optional ChunkStore holding chunk text when vector metadata carries only IDs
+        self.chunk_store = chunk_store
+        # MMR reads vectors kept by the chunk store (CHUNK_STORE_VECTOR_DTYPE) for the shortlist
+        # only, instead of pulling full float vectors for every match from the index
+        self.local_vectors = chunk_store is not None and chunk_store.vector_dtype != "none"
+        # Only the best candidates by vector score have their text fetched and re-ranked
+        self.max_rerank_candidates = int(os.getenv("RERANK_MAX_CANDIDATES", "30"))
+        self._embedding_dimension = None
+        # embed_array reaches into HuggingFaceEmbeddings' private client; only
+        # used once warm_up has checked it matches embed_documents
+        self._fast_embed = False
+        # Candidates dropped because their text was in neither metadata nor the chunk store
+        self.missing_text_count = 0
+
+    def warm_up(self):
+        """
+        Exercise the embedding and cross-encoder models once (single query and
+        a small batch) so the first request doesn't pay one-time setup costs.
+        """
+        self.embeddings.embed_query("warm up")
+        self.embeddings.embed_documents(["warm up"] * 4)
+        # Caches the vector size reported in binary /internal/embed headers
+        self.embedding_dimension
+        self._fast_embed = self._check_fast_embed()
+        self.reranker.rerank("warm up", [{"text": "warm up", "score": 0.0}], top_k=1)
+
+    def _check_fast_embed(self) -> bool:
+        texts = ["warm up", "line one\nline two"]
+        try:
+            fast = self._encode_array(texts)
+        except Exception as e:
+            print(f"WARNING: Direct embedding unavailable ({e}); using embed_documents", flush=True)
+            return False
+        expected = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        if fast is None or fast.shape != expected.shape or not np.allclose(fast, expected, atol=1e-5):
+            print("WARNING: Direct embedding differs from embed_documents; using embed_documents", flush=True)
+            return False
+        return True
 
     def generate_embeddings(self, texts: List[str]):
         return self.embeddings.embed_documents(texts)
 
-    async def search(self, query: str, top_k: int = 10, namespace: str = None):
-        if not namespace:
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts straight into a (len(texts), dim) float32 array, skipping
+        the per-float Python lists that embed_documents builds.
+        """
+        matrix = self._encode_array(texts) if self._fast_embed else None
+        if matrix is None:
+            return np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        return matrix
+
+    def _encode_array(self, texts: List[str]) -> Optional[np.ndarray]:
+        client = getattr(self.embeddings, "_client", None)
+        if client is None or not hasattr(client, "encode"):
+            return None
+        # Same preprocessing and options as HuggingFaceEmbeddings.embed_documents
+        texts = [text.replace("\n", " ") for text in texts]
+        encode_kwargs = {**getattr(self.embeddings, "encode_kwargs", {}), "convert_to_numpy": True}
+        encode_kwargs.setdefault("show_progress_bar", False)
+        return np.asarray(client.encode(texts, **encode_kwargs), dtype=np.float32)
+
+    @property
+    def embedding_dimension(self) -> int:
+        if self._embedding_dimension is None:
+            self._embedding_dimension = len(self.embeddings.embed_query("dimension probe"))
+        return self._embedding_dimension
+
+    async def _query_namespace(self, namespace: str, query_vector: List[float], top_k: int):
+        """
+        Vector search in one namespace, timed separately so a slow shard is
+        visible in Server-Timing as vector_search.<namespace>.
+        """
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(
+                None,
+                lambda: self.index.query(
+                    vector=query_vector,
+                    top_k=top_k,
+                    include_metadata=True,
+                    include_vectors=self.diversifier.enabled and not self.local_vectors,
+                    filter=f"namespace = '{namespace}'"
+                )
+            )
+        except Exception as e:
+            print(f"ERROR: Upstash query failed for namespace {namespace}: {e}", flush=True)
+            return []
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            record_stage(f"vector_search.{re.sub(r'[^A-Za-z0-9_-]', '_', namespace)}", elapsed)
+
+    @staticmethod
+    def _normalize_scores(candidates: List[dict]):
+        """
+        Min-max normalize vector scores within each namespace so one
+        namespace's score range doesn't crowd the others out of re-ranking.
+        The raw score is kept as vector_score.
+        """
+        by_namespace = {}
+        for candidate in candidates:
+            by_namespace.setdefault(candidate["namespace"], []).append(candidate)
+        for group in by_namespace.values():
+            low = min(c["score"] for c in group)
+            high = max(c["score"] for c in group)
+            for c in group:
+                c["vector_score"] = c["score"]
+                c["score"] = (c["score"] - low) / (high - low) if high > low else 1.0
+
+    async def search(
+        self,
+        query: str,
+        top_k: int = 10,
+        namespace: Union[str, List[str], None] = None,
+        query_vector: Optional[List[float]] = None
+    ):
+        # One namespace, or several searched concurrently and merged before re-ranking
+        namespaces = [namespace] if isinstance(namespace, str) else list(dict.fromkeys(ns for ns in namespace or [] if ns))
+        if not namespaces or not namespaces[0]:
             print("ERROR: Namespace is required for search", flush=True)
             return []
             
-        print(f"DEBUG: Searching for '{query}' in {namespace}", flush=True)
+        print(f"DEBUG: Searching for '{query}' in {', '.join(namespaces)}", flush=True)
         try:
             # Step 1: Expand query if enabled
             if self.enable_expansion:
-                query_variations = self.query_expander.expand_query(query)
+                with stage("expand"):
+                    query_variations = self.query_expander.expand_query(query)
                 print(f"DEBUG: Expanded query to {len(query_variations)} variations", flush=True)
             else:
                 query_variations = [query]
             
             # Step 2: Retrieve results for all query variations
-            local_results = []
-            seen_texts = set()  # For deduplication
+            candidates = {}  # vector ID -> result, for deduplication across variations
             
             loop = asyncio.get_running_loop()
+            precomputed_vector = query_vector
             
             for query_var in query_variations:
                 # Generate embedding for this variation
-                query_vector = await loop.run_in_executor(None, self.embeddings.embed_query, query_var)
+                # Reuse the embedding computed by the intent router for the original query
+                if query_var == query and precomputed_vector is not None:
+                    query_vector = precomputed_vector
+                else:
+                    with stage("embed"):
+                        query_vector = await loop.run_in_executor(None, self.embeddings.embed_query, query_var)
                 
-                # Search Upstash
+                # Search Upstash, fanning out to every namespace at once
                 # Use metadata filtering for namespace
-                try:
-                    search_result = await loop.run_in_executor(
-                        None,
-                        lambda: self.index.query(
-                            vector=query_vector,
-                            top_k=top_k * 2,
-                            include_metadata=True,
-                            filter=f"namespace = '{namespace}'"
-                        )
+                with stage("vector_search"):
+                    search_results = await asyncio.gather(
+                        *(self._query_namespace(ns, query_vector, top_k * 2) for ns in namespaces)
                     )
-                except Exception as e:
-                    print(f"ERROR: Upstash query failed: {e}", flush=True)
-                    continue
 
-                # Add results, avoiding duplicates
-                for res in search_result:
-                    text = res.metadata.get("text")
-                    if text and text not in seen_texts:
-                        seen_texts.add(text)
-                        local_results.append({
-                            "text": text,
+                # Add results, keeping the best score per vector
+                for ns, search_result in zip(namespaces, search_results):
+                    for res in search_result:
+                        metadata = res.metadata or {}
+                        existing = candidates.get(res.id)
+                        if existing is not None:
+                            existing["score"] = max(existing["score"], res.score)
+                            continue
+                        candidates[res.id] = {
+                            "id": res.id,
+                            # Legacy vectors still carry their text in metadata
+                            "text": metadata.get("text"),
                             "score": res.score,
-                            "metadata": res.metadata.get("metadata"),
-                            "url": res.metadata.get("url"),
+                            "metadata": {k: v for k, v in metadata.items() if k != "text"},
+                            "url": metadata.get("url"),
+                            "namespace": ns,
+                            "vector": getattr(res, "vector", None),
                             "source_type": "local"
-                        })
+                        }
+            
+            if len(namespaces) > 1:
+                self._normalize_scores(list(candidates.values()))
+            
+            # Fetch text lazily, in one batch, only for candidates that will be re-ranked
+            shortlisted = sorted(candidates.values(), key=lambda r: r["score"], reverse=True)
+            if self.max_rerank_candidates > 0:
+                shortlisted = shortlisted[:self.max_rerank_candidates]
+            missing_ids = [r["id"] for r in shortlisted if not r["text"]]
+            if missing_ids and self.chunk_store is not None:
+                with stage("chunk_fetch"):
+                    texts = await loop.run_in_executor(None, self.chunk_store.get_many, missing_ids)
+                for r in shortlisted:
+                    if not r["text"]:
+                        r["text"] = texts.get(r["id"])
+            
+            missing_vector_ids = [r["id"] for r in shortlisted if r["vector"] is None]
+            if self.diversifier.enabled and missing_vector_ids and self.local_vectors:
+                # Vectors ingested before local storage was enabled are missing and count as similar to nothing
+                with stage("chunk_fetch"):
+                    vectors = await loop.run_in_executor(None, self.chunk_store.get_vectors, missing_vector_ids)
+                for r in shortlisted:
+                    if r["vector"] is None:
+                        r["vector"] = vectors.get(r["id"])
+            
+            local_results = []
+            seen_texts = set()  # Same text can live under several sources
+            missing_text = 0
+            for r in shortlisted:
+                if not r["text"]:
+                    missing_text += 1
+                elif r["text"] not in seen_texts:
+                    seen_texts.add(r["text"])
+                    local_results.append(r)
+            if missing_text:
+                # Usually a lost or unshared chunk store (DATA_DIR not on a persistent volume)
+                self.missing_text_count += missing_text
+                print(
+                    f"WARNING: {missing_text} of {len(shortlisted)} candidates have no chunk text "
+                    f"({self.missing_text_count} since startup); check ENABLE_CHUNK_STORE/DATA_DIR",
+                    flush=True
+                )
             
             all_results = local_results
             print(f"DEBUG: Retrieved {len(local_results)} local results", flush=True)
             
             # Step 3: Re-rank results using cross-encoder
-            reranked_results = self.reranker.rerank(query, all_results, top_k)
+            # With MMR, every candidate is scored so diversification can pick from all of them
+            with stage("rerank"):
+                reranked_results = self.reranker.rerank(
+                    query, all_results, len(all_results) if self.diversifier.enabled else top_k
+                )
+            
+            # Step 4: Optionally diversify so near-identical chunks don't fill every context slot
+            if self.diversifier.enabled:
+                with stage("mmr"):
+                    reranked_results = self.diversifier.diversify(reranked_results, top_k)
+            for r in reranked_results:
+                r.pop("vector", None)
             
             print(f"DEBUG: Returning {len(reranked_results)} re-ranked results", flush=True)
             return reranked_results
@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# (previous summary, messages to fold in) -> new summary
+Summarizer = Callable[[str, List[Dict[str, str]]], Awaitable[str]]
+
+class ConversationSession:
+    """
+    Server-side conversation state: a rolling summary of older turns plus
+    the most recent messages verbatim.
+    """
+
+    def __init__(self, session_id: str, summary: str = "", messages: Optional[List[Dict[str, str]]] = None,
+                 updated_at: Optional[float] = None):
+        self.session_id = session_id
+        self.summary = summary
+        self.messages: List[Dict[str, str]] = messages or []
+        self.updated_at = updated_at or time.time()
+        # Formatted history messages, cached until the session changes (not persisted)
+        self.prompt_prefix: Optional[List[Dict[str, str]]] = None
+        self.summarizing = False
+
+    def touch(self):
+        self.prompt_prefix = None
+        self.updated_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"session_id": self.session_id, "summary": self.summary, "messages": self.messages}
+
+class SessionStore:
+    """
+    LRU store of conversation sessions keyed by session ID, optionally
+    written through to SQLite (SESSION_BACKEND=sqlite) so sessions survive
+    restarts and are shared between worker processes.
+
+    Clients send only the new message. Once a session holds more than
+    SESSION_RECENT_MESSAGES messages, the oldest ones are folded into the
+    rolling summary by a background task, so the prompt carries a summary
+    plus a few recent turns no matter how long the conversation gets.
+
+    With SQLite, every change is applied to the stored row inside one
+    write transaction rather than by saving the in-memory copy, so turns
+    appended by other workers are never overwritten.
+    """
+
+    MAX_SESSION_ID_LENGTH = 128
+    # Expired rows are purged from disk once every this many writes
+    PURGE_EVERY_WRITES = 100
+
+    def __init__(self, path: Optional[str] = None):
+        self.max_sessions = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+        self.ttl_seconds = float(os.getenv("SESSION_TTL_SECONDS", str(24 * 60 * 60)))
+        self.recent_messages = int(os.getenv("SESSION_RECENT_MESSAGES", "6"))
+        # Upper bound while summaries can't be produced (e.g. LLM unavailable)
+        self.max_messages = max(self.recent_messages * 4, 20)
+        # In-memory sessions are per process: with several workers, a session
+        # would lose its history whenever a request lands on another worker
+        workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+        self.backend = os.getenv("SESSION_BACKEND", "sqlite" if workers > 1 else "memory").lower()
+        if self.backend == "memory" and workers > 1:
+            raise ValueError("SESSION_BACKEND=memory requires WEB_CONCURRENCY=1; use sqlite with multiple workers")
+
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self._tasks = set()
+        self._writes = 0
+
+        self.path = None
+        if self.backend == "sqlite":
+            data_dir = os.getenv("DATA_DIR", "data")
+            self.path = path or os.path.join(data_dir, "sessions.db")
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS sessions (
+                        session_id TEXT PRIMARY KEY,
+                        data TEXT NOT NULL,
+                        updated_at REAL NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at);
+                """)
+        elif self.backend != "memory":
+            raise ValueError("SESSION_BACKEND must be 'memory' or 'sqlite'")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _load(self, session_id: str, cached: Optional[ConversationSession]) -> Optional[ConversationSession]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT data, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return cached
+        # Another worker may have written since; keep our copy (and its prompt cache) if not
+        if cached is not None and cached.updated_at >= row[1]:
+            return cached
+        data = json.loads(row[0])
+        return ConversationSession(session_id, data.get("summary", ""), data.get("messages", []), row[1])
+
+    def _update(self, session: ConversationSession,
+                change: Callable[[str, List[Dict[str, str]]], Optional[Tuple[str, List[Dict[str, str]]]]]
+                ) -> Optional[ConversationSession]:
+        """
+        Apply change(summary, messages) -> (summary, messages) to the stored
+        session and return the result, or None if change declined. Runs
+        under the database write lock, so concurrent updates from other
+        workers are serialized instead of overwriting each other.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT data, updated_at FROM sessions WHERE session_id = ?", (session.session_id,)
+            ).fetchone()
+            if row is None:
+                summary, messages, updated_at = session.summary, session.messages, 0.0
+            else:
+                data = json.loads(row[0])
+                summary, messages, updated_at = data.get("summary", ""), data.get("messages", []), row[1]
+            changed = change(summary, list(messages))
+            if changed is None:
+                return None
+            # Strictly newer than the row, so other workers' caches notice the change
+            stored = ConversationSession(session.session_id, changed[0], changed[1],
+                                         max(time.time(), updated_at + 1e-6))
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)",
+                (stored.session_id, json.dumps(stored.to_dict()), stored.updated_at),
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY_WRITES == 0:
+                conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+        return stored
+
+    @staticmethod
+    def _adopt(session: ConversationSession, stored: Optional[ConversationSession]):
+        # Writes can finish out of order; never go back to an older state
+        if stored is None or stored.updated_at < session.updated_at:
+            return
+        session.summary = stored.summary
+        session.messages = stored.messages
+        session.prompt_prefix = None
+        session.updated_at = stored.updated_at
+
+    async def find(self, session_id: str) -> Optional[ConversationSession]:
+        """
+        Return an existing, unexpired session without creating or caching one.
+        """
+        session = self._sessions.get(session_id)
+        if self.path is not None:
+            loop = asyncio.get_running_loop()
+            session = await loop.run_in_executor(None, self._load, session_id, session)
+        if session is None or session.updated_at < time.time() - self.ttl_seconds:
+            return None
+        return session
+
+    async def get(self, session_id: str) -> Optional[ConversationSession]:
+        """
+        Return an existing, unexpired session and keep it in the LRU.
+        """
+        session = await self.find(session_id)
+        if session is not None:
+            self._cache(session)
+        return session
+
+    async def create(self) -> ConversationSession:
+        """
+        Start a session under a new random ID. IDs are only issued here, so
+        knowing one is what grants access to the conversation.
+        """
+        session = ConversationSession(uuid.uuid4().hex)
+        if self.path is not None:
+            # Stored right away so the next turn may land on any worker
+            loop = asyncio.get_running_loop()
+            self._adopt(session, await loop.run_in_executor(
+                None, self._update, session, lambda summary, messages: (summary, messages)
+            ))
+        self._cache(session)
+        return session
+
+    def _cache(self, session: ConversationSession):
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    async def delete(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        if self.path is not None:
+            def _delete():
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            await asyncio.get_running_loop().run_in_executor(None, _delete)
+
+    async def append_turn(self, session: ConversationSession, question: str, answer: str, summarize: Summarizer):
+        """
+        Record a question/answer pair and, if the session has outgrown its
+        recent-message window, refresh the summary in the background.
+        """
+        turn = [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+        if self.path is None:
+            session.messages.extend(turn)
+            if len(session.messages) > self.max_messages:
+                del session.messages[:len(session.messages) - self.max_messages]
+            session.touch()
+        else:
+            def append(summary, messages):
+                return summary, (messages + turn)[-self.max_messages:]
+            loop = asyncio.get_running_loop()
+            self._adopt(session, await loop.run_in_executor(None, self._update, session, append))
+
+        if len(session.messages) > self.recent_messages and not session.summarizing:
+            session.summarizing = True
+            task = asyncio.ensure_future(self._refresh_summary(session, summarize))
+            # Keep a reference so the task isn't garbage-collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _refresh_summary(self, session: ConversationSession, summarize: Summarizer):
+        try:
+            # Only the overflow is sent: the summary is updated incrementally
+            previous_summary = session.summary
+            overflow = list(session.messages[:len(session.messages) - self.recent_messages])
+            summary = await summarize(previous_summary, overflow)
+            if not summary:
+                return
+            if self.path is None:
+                # Turns appended meanwhile stay; match by identity, not equality
+                folded = {id(m) for m in overflow}
+                session.messages = [m for m in session.messages if id(m) not in folded]
+                session.summary = summary
+                session.touch()
+                return
+
+            def fold(stored_summary, messages):
+                # Another worker may have folded these turns already
+                if stored_summary != previous_summary or messages[:len(overflow)] != overflow:
+                    return None
+                return summary, messages[len(overflow):]
+            loop = asyncio.get_running_loop()
+            self._adopt(session, await loop.run_in_executor(None, self._update, session, fold))
+        except Exception as e:
+            # Keep the messages; they are folded in on a later turn
+            print(f"WARNING: Session summary refresh failed for {session.session_id}: {e}", flush=True)
+        finally:
+            session.summarizing = False
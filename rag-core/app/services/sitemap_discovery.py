@@ -0,0 +1,140 @@
+import os
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+from xml.etree.ElementTree import XMLPullParser, ParseError
+import httpx
+
+class SitemapDiscovery:
+    """
+    URL discovery from robots.txt and sitemaps, without rendering pages.
+
+    Sitemaps (plain or gzipped, including sitemap indexes) are streamed
+    through an incremental XML parser, so memory stays flat even for
+    50,000-URL files. URLs disallowed by robots.txt or on another host
+    are dropped, and the rest are returned newest `lastmod` first.
+    """
+
+    USER_AGENT = "Mozilla/5.0 (compatible; VeloraBot/1.0)"
+
+    def __init__(self):
+        self.max_urls = int(os.getenv("SITEMAP_MAX_URLS", "50000"))
+        self.max_files = int(os.getenv("SITEMAP_MAX_FILES", "20"))
+        # Protocol limit is 50MB uncompressed per file; also guards against gzip bombs
+        self.max_bytes = int(os.getenv("SITEMAP_MAX_BYTES", str(50 * 1024 * 1024)))
+        self.timeout = float(os.getenv("SITEMAP_TIMEOUT_SECONDS", "20"))
+
+    async def discover(self, root_url: str) -> List[Tuple[str, Optional[float]]]:
+        """
+        Returns (url, lastmod epoch seconds or None) for the root URL's host,
+        most recently modified first.
+        """
+        parsed = urlparse(root_url)
+        origin = f"{parsed.scheme}://{parsed.netloc}"
+        async with httpx.AsyncClient(
+            timeout=self.timeout, follow_redirects=True, headers={"User-Agent": self.USER_AGENT}
+        ) as client:
+            robots = await self._fetch_robots(client, origin)
+            pending = list(robots.site_maps() or []) or [f"{origin}/sitemap.xml"]
+
+            found: Dict[str, Optional[float]] = {}
+            seen_sitemaps = set()
+            while pending and len(seen_sitemaps) < self.max_files and len(found) < self.max_urls:
+                sitemap_url = pending.pop(0)
+                if sitemap_url in seen_sitemaps:
+                    continue
+                seen_sitemaps.add(sitemap_url)
+                entries = self._stream_entries(client, sitemap_url)
+                try:
+                    async for kind, loc, lastmod in entries:
+                        if kind == "sitemap":
+                            pending.append(urljoin(sitemap_url, loc))
+                            continue
+                        url = urljoin(sitemap_url, loc)
+                        if urlparse(url).netloc != parsed.netloc or not robots.can_fetch(self.USER_AGENT, url):
+                            continue
+                        if url not in found or (lastmod or 0) > (found[url] or 0):
+                            found[url] = lastmod
+                        if len(found) >= self.max_urls:
+                            break
+                except (httpx.HTTPError, ParseError, zlib.error, ValueError) as e:
+                    print(f"WARNING: Failed to read sitemap {sitemap_url}: {e}", flush=True)
+                finally:
+                    # Closes the response when we stop early
+                    await entries.aclose()
+
+        print(f"DEBUG: Discovered {len(found)} URLs from {len(seen_sitemaps)} sitemaps for {origin}", flush=True)
+        # Newest first; pages without lastmod go last
+        return sorted(found.items(), key=lambda item: item[1] if item[1] is not None else float("-inf"), reverse=True)
+
+    async def _fetch_robots(self, client: httpx.AsyncClient, origin: str) -> RobotFileParser:
+        robots = RobotFileParser()
+        try:
+            response = await client.get(f"{origin}/robots.txt")
+            lines = response.text.splitlines() if response.status_code == 200 else []
+        except httpx.HTTPError:
+            lines = []
+        # An empty rule set allows everything
+        robots.parse(lines)
+        return robots
+
+    async def _stream_entries(self, client: httpx.AsyncClient, sitemap_url: str):
+        """
+        Yields ("url" | "sitemap", loc, lastmod) while the body is downloading.
+        """
+        parser = XMLPullParser(events=("start", "end"))
+        root = None
+        decompressor = None
+        total = 0
+
+        async with client.stream("GET", sitemap_url) as response:
+            response.raise_for_status()
+            # Content-Encoding gzip is decoded by httpx; .xml.gz files are not
+            async for data in response.aiter_bytes():
+                if decompressor is None and total == 0 and data[:2] == b"\x1f\x8b":
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                if decompressor is not None:
+                    data = decompressor.decompress(data, self.max_bytes - total + 1)
+                total += len(data)
+                if total > self.max_bytes:
+                    raise ValueError(f"sitemap exceeds {self.max_bytes} bytes")
+                parser.feed(data)
+
+                for event, element in parser.read_events():
+                    if event == "start":
+                        if root is None:
+                            root = element
+                        continue
+                    tag = self._local_name(element.tag)
+                    if tag in ("url", "sitemap"):
+                        loc = lastmod = None
+                        for child in element:
+                            name = self._local_name(child.tag)
+                            if name == "loc":
+                                loc = (child.text or "").strip()
+                            elif name == "lastmod":
+                                lastmod = self._parse_lastmod(child.text)
+                        # Drop parsed entries so the tree never grows
+                        root.clear()
+                        if loc:
+                            yield tag, loc, lastmod
+        parser.close()
+
+    @staticmethod
+    def _local_name(tag: str) -> str:
+        return tag.rsplit("}", 1)[-1]
+
+    @staticmethod
+    def _parse_lastmod(value: Optional[str]) -> Optional[float]:
+        # W3C datetime: a date, or a date and time with a zone designator
+        if not value:
+            return None
+        try:
+            parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
@@ -0,0 +1,64 @@
+import time
+import asyncio
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+class StartupTracker:
+    """
+    Tracks service initialization so the app can accept connections (and
+    answer liveness probes) immediately while models load in the background.
+
+    `ensure_ready` is idempotent and safe to call from every request: the
+    first caller starts initialization, everyone else waits on the same task.
+    That also covers runtimes that never deliver the ASGI startup event
+    (e.g. serverless entry points).
+    """
+
+    def __init__(self):
+        self.created_at = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.ready = False
+        self.error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - start) * 1000, 2)
+            print(f"INFO: Startup phase '{name}' took {self.phases[name]}ms", flush=True)
+
+    async def ensure_ready(self, initialize: Callable[[], None]):
+        """
+        Run the (blocking) initializer once in a worker thread and wait for it.
+        """
+        if self.ready:
+            return
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._initialize(initialize))
+        await asyncio.shield(self._task)
+
+    async def _initialize(self, initialize: Callable[[], None]):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, initialize)
+        except Exception as e:
+            self.error = str(e)
+            # Let the next request retry instead of failing forever
+            self._task = None
+            print(f"ERROR: Service initialization failed: {e}", flush=True)
+            raise
+        self.phases["total"] = round((time.perf_counter() - self.created_at) * 1000, 2)
+        self.error = None
+        self.ready = True
+
+    def status(self) -> Dict:
+        if self.ready:
+            state = "ready"
+        elif self.error:
+            state = "failed"
+        else:
+            state = "starting"
+        return {"status": state, "startup_ms": dict(self.phases), "error": self.error}
@@ -0,0 +1,56 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# Per-request stage timings (milliseconds), populated by the request middleware
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+def start_request_timing() -> Dict[str, float]:
+    """
+    Start collecting stage timings for the current request.
+
+    The returned dict is shared by reference, so stages recorded inside
+    tasks spawned for this request (which copy the context) still land in it.
+    """
+    timings: Dict[str, float] = {}
+    _stage_timings.set(timings)
+    return timings
+
+def record_stage(name: str, duration_ms: float):
+    """
+    Add a duration to a named stage. Repeated stages (e.g. one embedding per
+    query variation) are accumulated. No-op outside of a timed request.
+    """
+    timings = _stage_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + duration_ms
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, (time.perf_counter() - start) * 1000)
+
+def format_server_timing(timings: Dict[str, float]) -> str:
+    """
+    Render timings as a W3C Server-Timing header value.
+    """
+    return ", ".join(f"{name};dur={duration:.2f}" for name, duration in timings.items())
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                try:
+                    timings[name] = float(value)
+                except ValueError:
+                    pass
+    return timings
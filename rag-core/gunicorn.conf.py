@@ -0,0 +1,98 @@
+"""
+Pre-fork serving configuration.
+
+The master imports the app and loads every model once, then forks workers
+that share the weights copy-on-write. Usage:
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Environment:
+    WEB_CONCURRENCY     number of worker processes (default: usable CPUs, at most 4)
+    TORCH_NUM_THREADS   intra-op threads per worker (default: CPUs / workers)
+    PORT                listen port (default: 8000)
+"""
+import gc
+import os
+
+# Tokenizers spawn their own thread pool; it must not exist across fork()
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+# Workers each hold their own LLM/embedding concurrency slots; more than this
+# needs WEB_CONCURRENCY set explicitly
+DEFAULT_MAX_WORKERS = 4
+
+def _usable_cpus() -> int:
+    """
+    CPUs this process may actually use. os.cpu_count() reports the host's
+    cores, not the container's affinity mask or cgroup CPU quota.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available on macOS
+        cpus = os.cpu_count() or 1
+    try:
+        # cgroup v2: "<quota> <period>", or "max <period>" when unlimited
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        try:
+            # cgroup v1: quota is -1 when unlimited
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                quota = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if quota > 0 and period > 0:
+                cpus = min(cpus, max(1, quota // period))
+        except (OSError, ValueError):
+            pass
+    return max(1, cpus)
+
+_cpu_count = _usable_cpus()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(_cpu_count, DEFAULT_MAX_WORKERS))))
+# The app reads this too (e.g. per-process session storage must not be used with several workers)
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+def _threads_per_worker() -> int:
+    configured = os.getenv("TORCH_NUM_THREADS")
+    if configured:
+        return max(1, int(configured))
+    # Split the cores between workers so they don't oversubscribe each other
+    return max(1, _cpu_count // max(1, workers))
+
+def on_starting(server):
+    import torch
+
+    # Single-threaded in the master: an OpenMP pool created before fork()
+    # is not fork-safe, and the master never serves requests anyway
+    torch.set_num_threads(1)
+
+    from app import main
+    main.load_services()
+
+    # Move everything allocated so far out of the collector's reach, so
+    # worker GC passes don't write to (and un-share) the master's pages
+    gc.collect()
+    gc.freeze()
+    server.log.info("Models loaded in master; forking %s workers", workers)
+
+def post_fork(server, worker):
+    import torch
+
+    threads = _threads_per_worker()
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Already initialized in this process
+        pass
+    server.log.info("Worker %s using %s torch threads", worker.pid, threads)
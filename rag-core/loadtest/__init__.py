@@ -0,0 +1,5 @@
+"""
+Concurrent load-test harness for the RAG core service.
+
+Run with: python -m loadtest --help
+"""
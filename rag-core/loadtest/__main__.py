@@ -0,0 +1,75 @@
+import argparse
+import sys
+
+from loadtest.harness import LoadTestConfig, run_load_test
+
+def _int_list(value: str):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def main():
+    defaults = LoadTestConfig()
+    parser = argparse.ArgumentParser(
+        prog="python -m loadtest",
+        description="Drive concurrent /query and /internal/ingest-files traffic against app.main:app "
+                    "using local stand-ins for Upstash and the LLM.",
+    )
+    parser.add_argument("--concurrency", type=_int_list, default=defaults.concurrency_levels,
+                        help="Comma-separated concurrency levels (default: 1,8,32)")
+    parser.add_argument("--duration", type=float, default=defaults.duration_s, help="Seconds per concurrency level")
+    parser.add_argument("--query-ratio", type=float, default=defaults.query_ratio,
+                        help="Fraction of requests that are queries; the rest are file ingests")
+    parser.add_argument("--namespace", default=defaults.namespace)
+    parser.add_argument("--top-k", type=int, default=defaults.top_k)
+    parser.add_argument("--seed-documents", type=int, default=defaults.seed_documents,
+                        help="Documents ingested before measuring")
+    parser.add_argument("--vector-latency-ms", type=float, default=defaults.vector_latency_ms)
+    parser.add_argument("--vector-jitter-ms", type=float, default=defaults.vector_jitter_ms)
+    parser.add_argument("--llm-latency-ms", type=float, default=defaults.llm_latency_ms)
+    parser.add_argument("--llm-jitter-ms", type=float, default=defaults.llm_jitter_ms)
+    parser.add_argument("--llm-error-rate", type=float, default=defaults.llm_error_rate,
+                        help="Fraction of LLM stand-in calls that fail with 503")
+    parser.add_argument("--mmr", action="store_true",
+                        help="Enable MMR diversification to measure its overhead (mmr stage, vector_search)")
+    parser.add_argument("--answer-cache", action="store_true",
+                        help="Keep the answer cache on; the report then shows its hit ratio "
+                             "(off by default so /query latency reflects retrieval and the LLM call)")
+    parser.add_argument("--health-interval-ms", type=float, default=defaults.health_interval_ms)
+    parser.add_argument("--blocking-threshold-ms", type=float, default=defaults.blocking_threshold_ms,
+                        help="Flag event-loop blocking when /health p99 exceeds this")
+    parser.add_argument("--port", type=int, default=defaults.port)
+    parser.add_argument("--llm-port", type=int, default=defaults.llm_port)
+    parser.add_argument("--json", dest="json_path", help="Also write the report as JSON to this path")
+    parser.add_argument("--verbose", action="store_true", help="Show service logs while running")
+    args = parser.parse_args()
+
+    if not 0.0 <= args.query_ratio <= 1.0:
+        parser.error("--query-ratio must be between 0 and 1")
+
+    config = LoadTestConfig(
+        concurrency_levels=args.concurrency,
+        duration_s=args.duration,
+        query_ratio=args.query_ratio,
+        namespace=args.namespace,
+        top_k=args.top_k,
+        seed_documents=args.seed_documents,
+        vector_latency_ms=args.vector_latency_ms,
+        vector_jitter_ms=args.vector_jitter_ms,
+        llm_latency_ms=args.llm_latency_ms,
+        llm_jitter_ms=args.llm_jitter_ms,
+        llm_error_rate=args.llm_error_rate,
+        mmr=args.mmr,
+        answer_cache=args.answer_cache,
+        health_interval_ms=args.health_interval_ms,
+        blocking_threshold_ms=args.blocking_threshold_ms,
+        port=args.port,
+        llm_port=args.llm_port,
+        verbose=args.verbose,
+    )
+    levels = run_load_test(config, args.json_path)
+
+    # Non-zero exit lets CI gate rollouts on a blocked event loop
+    if any(level["health"]["event_loop_blocked"] for level in levels):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
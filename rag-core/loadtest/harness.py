@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import tempfile
+import threading
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+import httpx
+import uvicorn
+
+from app.timing import parse_server_timing
+from loadtest.stubs import StubIndex
+from loadtest.llm_stub import create_app as create_llm_stub
+
+SAMPLE_QUERIES = [
+    "What services does the company offer?",
+    "Who is the CEO of the organization?",
+    "Where is the headquarters located?",
+    "How can I contact the support team?",
+    "What technology does the platform use?",
+    "Give me an overview of the company background.",
+    "What products are available for enterprises?",
+    "Describe the software development process.",
+]
+
+_TOPICS = ["services", "leadership", "technology", "products", "contact", "location", "company", "development"]
+_WORDS = [
+    "platform", "customers", "solutions", "delivery", "security", "analytics", "teams", "infrastructure",
+    "integration", "support", "quality", "strategy", "operations", "research", "engineering", "growth",
+]
+
+@dataclass
+class LoadTestConfig:
+    concurrency_levels: List[int] = field(default_factory=lambda: [1, 8, 32])
+    duration_s: float = 30.0
+    query_ratio: float = 0.9
+    namespace: str = "loadtest"
+    top_k: int = 5
+    seed_documents: int = 20
+    vector_latency_ms: float = 20.0
+    vector_jitter_ms: float = 5.0
+    llm_latency_ms: float = 800.0
+    llm_jitter_ms: float = 200.0
+    llm_error_rate: float = 0.0
+    mmr: bool = False
+    # Off by default: with a handful of fixed queries, cached answers would hide retrieval and LLM cost
+    answer_cache: bool = False
+    health_interval_ms: float = 50.0
+    blocking_threshold_ms: float = 100.0
+    host: str = "127.0.0.1"
+    port: int = 8765
+    llm_port: int = 8766
+    verbose: bool = False
+
+@dataclass
+class Sample:
+    kind: str
+    latency_ms: float
+    ok: bool
+    status: int
+    stages: Dict[str, float]
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def _latency_summary(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(_percentile(values, 50), 2),
+        "p90_ms": round(_percentile(values, 90), 2),
+        "p99_ms": round(_percentile(values, 99), 2),
+        "max_ms": round(max(values), 2) if values else 0.0,
+    }
+
+def _synthetic_document(rng: random.Random, doc_id: int) -> bytes:
+    topic = rng.choice(_TOPICS)
+    paragraphs = []
+    for p in range(rng.randint(4, 8)):
+        sentence_count = rng.randint(3, 6)
+        sentences = [
+            f"The {topic} {' '.join(rng.choice(_WORDS) for _ in range(rng.randint(4, 9)))}."
+            for _ in range(sentence_count)
+        ]
+        paragraphs.append(f"Section {p + 1} of document {doc_id} about {topic}. " + " ".join(sentences))
+    return "\n\n".join(paragraphs).encode("utf-8")
+
+def _serve_in_thread(app, host: str, port: int, verbose: bool):
+    server = uvicorn.Server(uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        log_level="info" if verbose else "warning",
+        access_log=verbose,
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Load-test server on port {port} failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+def start_servers(config: LoadTestConfig):
+    """
+    Start the OpenAI-compatible LLM stand-in, import `app.main:app` pointed at
+    it, swap the Upstash client for an in-memory stand-in and serve the app
+    with uvicorn. Each server runs on its own thread and event loop.
+    """
+    llm_server = _serve_in_thread(
+        create_llm_stub(config.llm_latency_ms, config.llm_jitter_ms, config.llm_error_rate),
+        config.host, config.llm_port, config.verbose,
+    )
+
+    # The Upstash client is replaced below; dummy credentials only satisfy the constructors
+    os.environ.setdefault("UPSTASH_VECTOR_REST_URL", "http://upstash.stub.invalid")
+    os.environ.setdefault("UPSTASH_VECTOR_REST_TOKEN", "stub-token")
+    os.environ["LLM_BASE_URL"] = f"http://{config.host}:{config.llm_port}/v1"
+    os.environ["LLM_API_KEY"] = "stub-key"
+    # Keep the namespace catalog of each run separate from real data
+    os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="rag-loadtest-"))
+    # Compare runs with and without --mmr; its cost shows up as the "mmr" stage
+    os.environ["ENABLE_MMR"] = "true" if config.mmr else "false"
+    os.environ["ENABLE_ANSWER_CACHE"] = "true" if config.answer_cache else "false"
+
+    from app import main as app_main
+
+    # Construct services up front so their Upstash clients can be swapped before serving
+    app_main.load_services()
+    index = StubIndex(config.vector_latency_ms, config.vector_jitter_ms)
+    app_main.retrieval_service.index = index
+    app_main.ingestion_service.index = index
+    if app_main.lifecycle_manager is not None:
+        app_main.lifecycle_manager.index = index
+
+    app_server = _serve_in_thread(app_main.app, config.host, config.port, config.verbose)
+    # Don't measure while the background warm-up is still running
+    while not app_main.startup.ready:
+        if app_main.startup.error:
+            raise RuntimeError(f"Service initialization failed: {app_main.startup.error}")
+        time.sleep(0.1)
+    return [app_server, llm_server]
+
+async def _send_query(client: httpx.AsyncClient, config: LoadTestConfig, rng: random.Random) -> Sample:
+    payload = {
+        "query": rng.choice(SAMPLE_QUERIES),
+        "top_k": config.top_k,
+        "namespace": config.namespace,
+        "history": [],
+    }
+    return await _timed(client, "query", "POST", "/query", json=payload)
+
+async def _send_ingest(client: httpx.AsyncClient, config: LoadTestConfig, rng: random.Random) -> Sample:
+    doc_id = rng.randint(0, 1_000_000)
+    files = [("files", (f"loadtest-{doc_id}.txt", _synthetic_document(rng, doc_id), "text/plain"))]
+    return await _timed(client, "ingest", "POST", "/internal/ingest-files", files=files, data={"namespace": config.namespace})
+
+async def _timed(client: httpx.AsyncClient, kind: str, method: str, path: str, **kwargs) -> Sample:
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, path, **kwargs)
+        latency = (time.perf_counter() - start) * 1000
+        stages = parse_server_timing(response.headers.get("Server-Timing", ""))
+        return Sample(kind, latency, response.status_code < 400, response.status_code, stages)
+    except httpx.HTTPError:
+        return Sample(kind, (time.perf_counter() - start) * 1000, False, 0, {})
+
+async def seed_namespace(client: httpx.AsyncClient, config: LoadTestConfig):
+    rng = random.Random(0)
+    for _ in range(config.seed_documents):
+        sample = await _send_ingest(client, config, rng)
+        if not sample.ok:
+            raise RuntimeError(f"Seeding failed with status {sample.status}")
+
+async def run_level(client: httpx.AsyncClient, config: LoadTestConfig, concurrency: int) -> Dict:
+    from app.main import answer_cache
+
+    samples: List[Sample] = []
+    health_latencies: List[float] = []
+    cache_before = dict(answer_cache.stats)
+    started = time.perf_counter()
+    deadline = started + config.duration_s
+
+    async def worker(worker_id: int):
+        rng = random.Random(worker_id)
+        while time.perf_counter() < deadline:
+            if rng.random() < config.query_ratio:
+                samples.append(await _send_query(client, config, rng))
+            else:
+                samples.append(await _send_ingest(client, config, rng))
+
+    async def health_probe():
+        # /health does no work, so its latency under load measures event-loop stalls
+        while time.perf_counter() < deadline:
+            sample = await _timed(client, "health", "GET", "/health")
+            health_latencies.append(sample.latency_ms)
+            await asyncio.sleep(config.health_interval_ms / 1000)
+
+    await asyncio.gather(health_probe(), *(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    report = {"concurrency": concurrency, "elapsed_s": round(elapsed, 2), "endpoints": {}}
+    for kind in sorted({s.kind for s in samples}):
+        kind_samples = [s for s in samples if s.kind == kind]
+        ok_samples = [s for s in kind_samples if s.ok]
+        stage_names = sorted({name for s in ok_samples for name in s.stages})
+        report["endpoints"][kind] = {
+            "requests": len(kind_samples),
+            "errors": len(kind_samples) - len(ok_samples),
+            "error_rate": round((len(kind_samples) - len(ok_samples)) / len(kind_samples), 4),
+            "throughput_rps": round(len(ok_samples) / elapsed, 2),
+            "latency": _latency_summary([s.latency_ms for s in ok_samples]),
+            "stages": {
+                name: {
+                    "mean_ms": round(sum(s.stages.get(name, 0.0) for s in ok_samples) / len(ok_samples), 2),
+                    "p99_ms": round(_percentile([s.stages[name] for s in ok_samples if name in s.stages], 99), 2),
+                }
+                for name in stage_names
+            },
+        }
+
+    health = _latency_summary(health_latencies)
+    health["samples"] = len(health_latencies)
+    health["event_loop_blocked"] = health["p99_ms"] > config.blocking_threshold_ms
+    report["health"] = health
+
+    if answer_cache.enabled:
+        cache = {name: answer_cache.stats[name] - cache_before[name] for name in cache_before}
+        lookups = sum(cache.values())
+        # Coalesced requests skip retrieval and the LLM call as well
+        cache["hit_ratio"] = round((cache["hits"] + cache["coalesced"]) / lookups, 4) if lookups else 0.0
+        report["answer_cache"] = cache
+    return report
+
+def format_report(config: LoadTestConfig, levels: List[Dict]) -> str:
+    lines = [
+        "=" * 78,
+        "RAG core load test",
+        f"duration/level={config.duration_s}s  query_ratio={config.query_ratio}  "
+        f"vector_latency={config.vector_latency_ms}ms  llm_latency={config.llm_latency_ms}ms  "
+        f"llm_error_rate={config.llm_error_rate}  mmr={'on' if config.mmr else 'off'}  "
+        f"answer_cache={'on' if config.answer_cache else 'off'}",
+        "=" * 78,
+    ]
+    for level in levels:
+        lines.append(f"\nconcurrency={level['concurrency']}  elapsed={level['elapsed_s']}s")
+        for kind, stats in level["endpoints"].items():
+            latency = stats["latency"]
+            lines.append(
+                f"  {kind:<7} reqs={stats['requests']:<6} err={stats['errors']:<4} "
+                f"rps={stats['throughput_rps']:<8} p50={latency['p50_ms']}ms p90={latency['p90_ms']}ms "
+                f"p99={latency['p99_ms']}ms max={latency['max_ms']}ms"
+            )
+            for name, stage_stats in stats["stages"].items():
+                lines.append(f"      {name:<14} mean={stage_stats['mean_ms']}ms p99={stage_stats['p99_ms']}ms")
+        cache = level.get("answer_cache")
+        if cache is not None:
+            lines.append(
+                f"  cache   hits={cache['hits']} coalesced={cache['coalesced']} misses={cache['misses']} "
+                f"hit_ratio={cache['hit_ratio']}"
+            )
+        health = level["health"]
+        flag = "  <-- EVENT LOOP BLOCKING" if health["event_loop_blocked"] else ""
+        lines.append(
+            f"  health  p50={health['p50_ms']}ms p99={health['p99_ms']}ms max={health['max_ms']}ms{flag}"
+        )
+    return "\n".join(lines)
+
+async def _run(config: LoadTestConfig) -> List[Dict]:
+    max_connections = max(config.concurrency_levels) + 2
+    async with httpx.AsyncClient(
+        base_url=f"http://{config.host}:{config.port}",
+        timeout=httpx.Timeout(300.0),
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+    ) as client:
+        await seed_namespace(client, config)
+        return [await run_level(client, config, concurrency) for concurrency in config.concurrency_levels]
+
+def run_load_test(config: LoadTestConfig, json_path: Optional[str] = None) -> List[Dict]:
+    # Service debug output would drown the report; keep it only when asked for
+    sink = sys.stdout if config.verbose else open(os.devnull, "w")
+    try:
+        with redirect_stdout(sink):
+            servers = start_servers(config)
+            try:
+                levels = asyncio.run(_run(config))
+            finally:
+                for server, thread in servers:
+                    server.should_exit = True
+                    thread.join(timeout=10)
+    finally:
+        if sink is not sys.stdout:
+            sink.close()
+
+    print(format_report(config, levels))
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump({"config": asdict(config), "levels": levels}, f, indent=2)
+    return levels
@@ -0,0 +1,93 @@
+"""
+OpenAI-compatible local stand-in for the LLM backend.
+
+Serves POST /v1/chat/completions (plain and SSE streaming) with configurable
+latency and error rate. Point the service at it with
+LLM_BASE_URL=http://127.0.0.1:8766/v1, or run it standalone:
+
+    python -m loadtest.llm_stub --port 8766 --latency-ms 800 --error-rate 0.05
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+STUB_ANSWER = "This is a simulated answer generated by the load-test stand-in model."
+
+def create_app(latency_ms: float = 800.0, jitter_ms: float = 200.0, error_rate: float = 0.0) -> FastAPI:
+    app = FastAPI(title="LLM stand-in")
+    app.state.latency_ms = latency_ms
+    app.state.jitter_ms = jitter_ms
+    app.state.error_rate = error_rate
+    app.state.requests = 0
+
+    def _delay() -> float:
+        return (app.state.latency_ms + random.uniform(0, app.state.jitter_ms)) / 1000
+
+    def _completion_chunk(model: str, delta: Dict[str, Any], finish_reason=None) -> str:
+        payload = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "stub")
+        app.state.requests += 1
+
+        if random.random() < app.state.error_rate:
+            await asyncio.sleep(_delay() / 4)
+            return JSONResponse(status_code=503, content={"error": {"message": "simulated backend failure"}})
+
+        if body.get("stream"):
+            words = STUB_ANSWER.split(" ")
+            per_token = _delay() / len(words)
+
+            async def events():
+                for i, word in enumerate(words):
+                    await asyncio.sleep(per_token)
+                    yield _completion_chunk(model, {"content": word if i == 0 else f" {word}"})
+                yield _completion_chunk(model, {}, finish_reason="stop")
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(_delay())
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": STUB_ANSWER},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(STUB_ANSWER.split()), "total_tokens": 0},
+        }
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m loadtest.llm_stub", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency-ms", type=float, default=800.0)
+    parser.add_argument("--jitter-ms", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms, args.jitter_ms, args.error_rate), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import re
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+def _simulate_latency(latency_ms: float, jitter_ms: float):
+    delay = latency_ms + random.uniform(0, jitter_ms)
+    if delay > 0:
+        time.sleep(delay / 1000)
+
+@dataclass
+class StubQueryResult:
+    id: str
+    score: float
+    metadata: Optional[Dict[str, Any]] = None
+    vector: Optional[List[float]] = None
+
+@dataclass
+class StubIndexInfo:
+    vector_count: int
+    dimension: int
+
+class StubIndex:
+    """
+    In-memory stand-in for the Upstash `Index` client.
+
+    Implements the subset of the client API the services use (query, upsert,
+    fetch, delete, reset, info) with brute-force cosine search, and sleeps for
+    a configurable latency on every call to mimic the REST round-trip. Calls
+    are synchronous and blocking, like the real client.
+    """
+
+    _FILTER_PATTERN = re.compile(r"(\w+)\s*=\s*'([^']*)'")
+
+    def __init__(self, latency_ms: float = 20.0, jitter_ms: float = 5.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._lock = threading.Lock()
+        self._vectors: Dict[str, Dict[str, Any]] = {}
+
+    def _matches(self, metadata: Dict[str, Any], filter: Optional[str]) -> bool:
+        if not filter:
+            return True
+        return all(str(metadata.get(key)) == value for key, value in self._FILTER_PATTERN.findall(filter))
+
+    def upsert(self, vectors: List[Dict[str, Any]]):
+        _simulate_latency(self.latency_ms, self.jitter_ms)
+        with self._lock:
+            for item in vectors:
+                self._vectors[item["id"]] = {
+                    "vector": np.asarray(item["vector"], dtype=np.float32),
+                    "metadata": item.get("metadata") or {},
+                }
+        return "Success"
+
+    def query(self, vector, top_k: int = 10, include_metadata: bool = False,
+              include_vectors: bool = False, filter: Optional[str] = None, **kwargs):
+        _simulate_latency(self.latency_ms, self.jitter_ms)
+        with self._lock:
+            candidates = [(vid, item) for vid, item in self._vectors.items() if self._matches(item["metadata"], filter)]
+        if not candidates:
+            return []
+
+        matrix = np.stack([item["vector"] for _, item in candidates])
+        query = np.asarray(vector, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        scores = matrix @ query / np.where(norms == 0, 1.0, norms)
+        order = np.argsort(-scores)[:top_k]
+
+        return [
+            StubQueryResult(
+                id=candidates[i][0],
+                score=float(scores[i]),
+                metadata=dict(candidates[i][1]["metadata"]) if include_metadata else None,
+                vector=candidates[i][1]["vector"].tolist() if include_vectors else None,
+            )
+            for i in order
+        ]
+
+    def fetch(self, ids: List[str], include_metadata: bool = False, include_vectors: bool = False, **kwargs):
+        _simulate_latency(self.latency_ms, self.jitter_ms)
+        with self._lock:
+            items = [(vid, self._vectors.get(vid)) for vid in ids]
+        return [
+            None if item is None else StubQueryResult(
+                id=vid,
+                score=0.0,
+                metadata=dict(item["metadata"]) if include_metadata else None,
+                vector=item["vector"].tolist() if include_vectors else None,
+            )
+            for vid, item in items
+        ]
+
+    def delete(self, ids: List[str], **kwargs):
+        _simulate_latency(self.latency_ms, self.jitter_ms)
+        with self._lock:
+            deleted = sum(1 for vid in ids if self._vectors.pop(vid, None) is not None)
+        return deleted
+
+    def reset(self, **kwargs):
+        _simulate_latency(self.latency_ms, self.jitter_ms)
+        with self._lock:
+            self._vectors.clear()
+
+    def info(self):
+        with self._lock:
+            count = len(self._vectors)
+            dimension = len(next(iter(self._vectors.values()))["vector"]) if count else 0
+        return StubIndexInfo(vector_count=count, dimension=dimension)
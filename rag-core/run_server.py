@@ -10,5 +10,15 @@ if sys.platform == "win32":
 import uvicorn
 
 if __name__ == "__main__":
-    # Run Uvicorn via Python script to ensure the Event Loop Policy is active
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=False)
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    
+    if workers > 1 and hasattr(os, "fork"):
+        # Pre-fork mode: models load once in the master and are shared copy-on-write
+        from gunicorn.app.wsgiapp import run
+        sys.argv = ["gunicorn", "-c", "gunicorn.conf.py", "app.main:app"]
+        run()
+    else:
+        if workers > 1:
+            print("WARNING: Multi-worker mode requires fork(); starting a single worker.", flush=True)
+        # Run Uvicorn via Python script to ensure the Event Loop Policy is active
+        uvicorn.run("app.main:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")), reload=False)